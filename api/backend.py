@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha256
+
+from django.conf import settings
+from graphql.backend import GraphQLCoreBackend
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import execute, ExecutionResult
+from graphql.language.base import parse
+from graphql.validation import validate
+
+from api.limits import check_limits
+from api.metrics import profile_operation
+
+
+def document_hash(document_string):
+    """sha256 of a query document, as used by persisted queries."""
+    return sha256(document_string.encode("utf-8")).hexdigest()
+
+
+class DocumentCacheBackend(GraphQLCoreBackend):
+    """
+    Core backend that parses and validates each query document only once.
+
+    Documents are kept in an LRU cache keyed by their hash, so a document
+    that is sent again skips parsing and validation and goes straight to
+    execution. Before execution, the depth and cost of the query are checked
+    against the limits of the user (see api.limits).
+    """
+
+    def __init__(self, size=None, executor=None):
+        super().__init__(executor=executor)
+        self.size = size or settings.GRAPHQL_DOCUMENT_CACHE_SIZE
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def document_from_string(self, schema, document_string):
+        key = (id(schema), document_hash(document_string))
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.hits += 1
+                self.documents.move_to_end(key)
+                return document
+
+        document = self.build_document(schema, document_string)
+        with self.lock:
+            self.misses += 1
+            self.documents[key] = document
+            if len(self.documents) > self.size:
+                self.documents.popitem(last=False)
+                self.evictions += 1
+        return document
+
+    def build_document(self, schema, document_string):
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        if errors:
+            run = lambda *args, **kwargs: ExecutionResult(errors=errors, invalid=True)
+        else:
+            run = partial(self.execute_document, schema, document_ast)
+        return GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=run,
+        )
+
+    def execute_document(self, schema, document_ast, root_value=None, context_value=None, **kwargs):
+        # graphene passes context and variables under their old names
+        context = context_value if context_value is not None else kwargs.get("context")
+        errors = check_limits(
+            schema,
+            document_ast,
+            context,
+            kwargs.get("variable_values") or kwargs.get("variables"),
+            kwargs.get("operation_name"),
+        )
+        if errors:
+            return ExecutionResult(errors=errors, invalid=True)
+
+        run = partial(execute, schema, document_ast, root_value, context_value, **dict(self.execute_params, **kwargs))
+        if settings.GRAPHQL_PROFILING:
+            return profile_operation(run, kwargs.get("operation_name"), document_ast, context)
+        return run()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.documents),
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+document_backend = DocumentCacheBackend()
@@ -0,0 +1,202 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from api.models import Membership
+
+
+class InvalidationStamps:
+    """
+    Times at which keys were invalidated, kept in the Django cache
+    SHARED_CACHE so that every process sees them: an entry cached before the
+    stamp of its key is stale. A stamp expires after timeout seconds, when
+    the entries cached before it have expired as well.
+
+    The stamps read from SHARED_CACHE are kept for
+    SHARED_CACHE_CHECK_INTERVAL seconds, so a cache hit is an in-process
+    lookup and another process's invalidation takes effect within that
+    interval. Invalidations of this process take effect right away.
+
+    With the default local memory cache a stamp only reaches the process that
+    sets it, several workers need a cache they share, e.g. Memcached.
+    """
+
+    def __init__(self, prefix, timeout, size):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.size = size
+        # key: (stamp, time it was read)
+        self.known = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.SHARED_CACHE]
+
+    def name(self, key):
+        return f"{self.prefix}:{key}"
+
+    def stale(self, keys, cached_at):
+        now = time.time()
+        with self.lock:
+            known = {key: self.known.get(key) for key in keys}
+        missing = [key for key, entry in known.items() if entry is None or entry[1] + settings.SHARED_CACHE_CHECK_INTERVAL <= now]
+        if missing:
+            stamps = self.cache.get_many([self.name(key) for key in missing])
+            for key in missing:
+                known[key] = (stamps.get(self.name(key), 0), now)
+            self.remember({key: known[key] for key in missing})
+        return any(stamp >= cached_at for stamp, read_at in known.values())
+
+    def remember(self, entries):
+        with self.lock:
+            for key, entry in entries.items():
+                self.known[key] = entry
+                self.known.move_to_end(key)
+            while len(self.known) > self.size:
+                self.known.popitem(last=False)
+
+    def invalidate(self, key):
+        def stamp():
+            now = time.time()
+            self.cache.set(self.name(key), now, self.timeout)
+            self.remember({key: (now, now)})
+
+        stamp()
+        # and again once committed, entries loaded in between read the old rows
+        transaction.on_commit(stamp)
+
+
+class MembershipCache:
+    """
+    Process wide LRU cache of the member ids of teams.
+
+    An entry lives for MEMBERSHIP_CACHE_TTL seconds. The membership signals
+    (see api.signals) invalidate entries in all processes through
+    InvalidationStamps, and every team event carries the member ids read by
+    the process that sent it, which refresh the entry of the receiving
+    process.
+    """
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size or settings.MEMBERSHIP_CACHE_SIZE
+        self.ttl = settings.MEMBERSHIP_CACHE_TTL if ttl is None else ttl
+        self.members = OrderedDict()
+        self.lock = threading.Lock()
+        self.stamps = InvalidationStamps("membership", self.ttl, self.size)
+
+    def get(self, team_id):
+        """Return the ids of the members of the team, loading them on a miss."""
+        now = time.time()
+        with self.lock:
+            entry = self.members.get(team_id)
+            if entry is not None:
+                self.members.move_to_end(team_id)
+        if entry is not None and entry[1] + self.ttl > now and not self.stamps.stale([team_id, "*"], entry[1]):
+            return entry[0]
+
+        member_ids = frozenset(Membership.objects.filter(team_id=team_id).values_list("user_id", flat=True))
+        self.set(team_id, member_ids, loaded_at=now)
+        return member_ids
+
+    def set(self, team_id, member_ids, loaded_at=None):
+        with self.lock:
+            self.members[team_id] = (frozenset(member_ids), loaded_at or time.time())
+            self.members.move_to_end(team_id)
+            if len(self.members) > self.size:
+                self.members.popitem(last=False)
+
+    def is_member(self, team_id, user_id):
+        return user_id in self.get(team_id)
+
+    def invalidate(self, team_id=None):
+        """Drop the entry of a team, or all entries if no team is given, in all processes."""
+        with self.lock:
+            if team_id is None:
+                self.members.clear()
+            else:
+                self.members.pop(team_id, None)
+        self.stamps.invalidate("*" if team_id is None else team_id)
+
+
+membership_cache = MembershipCache()
+
+
+class TokenCache:
+    """
+    Process wide LRU cache of verified JSON web tokens and their users.
+
+    An entry lives for JWT_CACHE_TTL seconds, or until the token expires if
+    that is earlier. The user signals (see api.signals) drop all tokens of a
+    user when it is saved, deleted or logged out, in all processes through
+    InvalidationStamps, so a password change or a deactivation takes effect
+    right away.
+    """
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size or settings.JWT_CACHE_SIZE
+        self.ttl = settings.JWT_CACHE_TTL if ttl is None else ttl
+        self.tokens = OrderedDict()
+        self.lock = threading.Lock()
+        self.stamps = InvalidationStamps("token-user", self.ttl, self.size)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token):
+        return sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token):
+        """Return a copy of the user of a cached token, or None."""
+        key = self.key(token)
+        with self.lock:
+            entry = self.tokens.get(key)
+        if entry is not None and (entry[1] <= time.time() or self.stamps.stale([entry[0].pk], entry[2])):
+            with self.lock:
+                self.tokens.pop(key, None)
+            entry = None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if key in self.tokens:
+                self.tokens.move_to_end(key)
+        return copy.copy(entry[0])
+
+    def set(self, token, user, expires=None, loaded_at=None):
+        """
+        Cache the user of a verified token; expires is the exp claim, if it is
+        checked, loaded_at the time before the user was read.
+        """
+        if not self.ttl:
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        if expires is not None:
+            expires_at = min(expires_at, expires)
+        with self.lock:
+            self.tokens[self.key(token)] = (copy.copy(user), expires_at, loaded_at or now)
+            self.tokens.move_to_end(self.key(token))
+            if len(self.tokens) > self.size:
+                self.tokens.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        """Drop the tokens of the user, in all processes."""
+        with self.lock:
+            for key in [key for key, (user, expires_at, cached_at) in self.tokens.items() if user.pk == user_id]:
+                del self.tokens[key]
+        self.stamps.invalidate(user_id)
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+
+
+token_cache = TokenCache()
@@ -0,0 +1,180 @@
+import asyncio
+import functools
+import json
+
+from asgiref.sync import async_to_sync
+from channels.consumer import get_handler_name
+from channels.exceptions import RequestAborted, RequestTimeout
+from channels.http import AsgiHandler
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import RequestDataTooBig
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.urls import set_script_prefix
+from graphene_django.settings import graphene_settings
+from graphene_subscriptions.consumers import GraphqlSubscriptionConsumer, AttrDict
+from rx.subjects import Subject
+
+from api.backend import document_backend
+from api.cache import membership_cache
+from api.events import TeamSubscriptionEvent
+from api.executors import db_sync_to_async, graphql_executor
+from api.subscriptions import shared_results, viewer_role, resolve_data
+
+
+class TeamSubscriptionConsumer(GraphqlSubscriptionConsumer):
+    """
+    Subscription consumer that only listens to the teams it subscribed to.
+
+    Instead of the global "subscriptions" group, resolvers join the group of
+    their team through ``info.context.join_group`` and events are pushed into
+    a stream owned by this connection, so an update is only evaluated by the
+    subscribers of its team.
+
+    With SHARED_SUBSCRIPTION_RESULTS enabled, the result for an event is
+    computed once per document and viewer role in this process and shared
+    between all its subscribers (see api.subscriptions).
+
+    Results sent for an event carry its commit time in the extensions of
+    the payload ({"committedAt": seconds since the epoch}), so clients can
+    measure how long the delivery took.
+    """
+
+    async def dispatch(self, message):
+        # run the handlers in the bounded db_executor, not the default executor
+        await db_sync_to_async(self.handle_message)(message)
+
+    def handle_message(self, message):
+        handler = getattr(self, get_handler_name(message), None)
+        if handler is None:
+            raise ValueError("No handler for message type %s" % message["type"])
+        handler(message)
+
+    def websocket_connect(self, message):
+        self.stream = Subject()
+        self.groups = set()
+        self.subscriptions = {}
+        self.shared = {}
+        self.scope["join_group"] = self.join_group
+
+        self.send({"type": "websocket.accept", "subprotocol": "graphql-ws"})
+
+    def websocket_disconnect(self, message):
+        for subscription in self.subscriptions.values():
+            subscription.dispose()
+        for group in self.groups:
+            async_to_sync(self.channel_layer.group_discard)(group, self.channel_name)
+
+        super().websocket_disconnect(message)
+
+    def join_group(self, group):
+        if group not in self.groups:
+            async_to_sync(self.channel_layer.group_add)(group, self.channel_name)
+            self.groups.add(group)
+
+    def websocket_receive(self, message):
+        request = json.loads(message["text"])
+        id = request.get("id")
+
+        if request["type"] == "start":
+            payload = request["payload"]
+
+            shared = settings.SHARED_SUBSCRIPTION_RESULTS
+
+            # shared subscriptions are only executed here to check and set
+            # them up, their events are resolved by shared_results
+            result = graphene_settings.SCHEMA.execute(
+                payload["query"],
+                operation_name=payload.get("operationName"),
+                variables=payload.get("variables"),
+                context=AttrDict(self.scope),
+                root=Subject() if shared else self.stream,
+                allow_subscriptions=True,
+                backend=document_backend,
+            )
+
+            if not hasattr(result, "subscribe"):
+                self._send_result(id, result)
+            elif shared:
+                self.shared[id] = payload
+            else:
+                self.subscriptions[id] = result.map(resolve_data).subscribe(functools.partial(self._send_result, id))
+
+        elif request["type"] == "stop":
+            self.shared.pop(id, None)
+            subscription = self.subscriptions.pop(id, None)
+            if subscription:
+                subscription.dispose()
+
+    def signal_fired(self, message):
+        event = TeamSubscriptionEvent.from_dict(message["event"])
+        # the member ids of the event are fresher than anything this process knows
+        membership_cache.set(event.instance.pk, event.member_ids)
+        # the results of the event are sent while it is dispatched
+        self.event = event
+        try:
+            self.stream.on_next(event)
+
+            user = self.scope["user"]
+            role = viewer_role(event.instance, user, event.member_ids)
+            for id, payload in self.shared.items():
+                result = shared_results.get(event, payload, user, role)
+                if result is not None:
+                    self._send_result(id, result)
+        finally:
+            self.event = None
+
+    def _send_result(self, id, result):
+        payload = {
+            "data": result.data,
+            "errors": list(map(str, result.errors)) if result.errors else None,
+        }
+        event = getattr(self, "event", None)
+        if event is not None:
+            payload["extensions"] = {"committedAt": event.committed_at}
+        self.send({"type": "websocket.send", "text": json.dumps({"id": id, "type": "data", "payload": payload})})
+
+
+class GraphQLHttpConsumer(AsgiHandler):
+    """
+    HTTP handler for the GraphQL endpoint under ASGI.
+
+    The request goes through the Django middleware and the GraphQL view like
+    with AsgiHandler, but in the bounded graphql_executor pool. A burst of
+    slow queries therefore queues up there instead of taking the threads
+    that websocket traffic needs (db_executor), and the response is sent
+    from the event loop in one go.
+    """
+
+    async def __call__(self, receive, send):
+        try:
+            body = await self.read_body(receive)
+        except RequestAborted:
+            return
+
+        loop = asyncio.get_event_loop()
+        messages = await loop.run_in_executor(graphql_executor, self.get_messages, body)
+        for message in messages:
+            await send(message)
+
+    def get_messages(self, body):
+        """Handle the request synchronously and return the response messages, like AsgiHandler.handle."""
+        set_script_prefix(settings.FORCE_SCRIPT_NAME or self.scope.get("root_path", "") or "")
+        signals.request_started.send(sender=self.__class__, scope=self.scope)
+        try:
+            request = self.request_class(self.scope, body)
+        except UnicodeDecodeError:
+            response = HttpResponseBadRequest()
+        except RequestTimeout:
+            response = HttpResponse("408 Request Timeout (upload too slow)", status=408)
+        except RequestAborted:
+            return []
+        except RequestDataTooBig:
+            response = HttpResponse("413 Payload too large", status=413)
+        else:
+            response = self.get_response(request)
+        try:
+            return list(self.encode_response(response))
+        finally:
+            # sends request_finished, which closes the old database connections
+            response.close()
@@ -0,0 +1,111 @@
+import threading
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection
+from graphene_subscriptions.events import ModelSubscriptionEvent, DELETED
+
+from api.models import Membership
+
+
+def team_group_name(team_id):
+    """Name of the channel layer group of the subscribers of a team."""
+    return f"team.{team_id}"
+
+
+class TeamSubscriptionEvent(ModelSubscriptionEvent):
+    """Model event that is only sent to the subscribers of one team."""
+
+    def __init__(self, operation=None, instance=None, member_ids=None, event_id=None, committed_at=None):
+        super().__init__(operation, instance)
+        if member_ids is None:
+            member_ids = Membership.objects.filter(team_id=self.instance.pk).values_list("user_id", flat=True)
+        self.member_ids = list(member_ids)
+        # identifies the event across all consumers that receive a copy of it
+        self.event_id = event_id or uuid.uuid4().hex
+        # when the change was committed (time.time()), to measure the delivery lag
+        self.committed_at = committed_at or time.time()
+
+    def send(self):
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            team_group_name(self.instance.pk), {"type": "signal.fired", "event": self.to_dict()}
+        )
+
+    def to_dict(self):
+        _dict = super().to_dict()
+        _dict["member_ids"] = self.member_ids
+        _dict["event_id"] = self.event_id
+        _dict["committed_at"] = self.committed_at
+        return _dict
+
+    @staticmethod
+    def from_dict(_dict):
+        return TeamSubscriptionEvent(
+            operation=_dict.get("operation"),
+            instance=_dict.get("instance"),
+            member_ids=_dict.get("member_ids"),
+            event_id=_dict.get("event_id"),
+            committed_at=_dict.get("committed_at"),
+        )
+
+
+class TeamEventCoalescer:
+    """
+    Merges the events of a team that are sent within TEAM_EVENT_WINDOW
+    milliseconds into one event carrying the latest state of the team.
+
+    The first event of a team starts a timer, later events only replace the
+    pending state, so the final state is always sent when the timer fires.
+    The merged event keeps the commit time of the first change, its lag
+    includes the wait. Deletions are sent right away and drop the pending
+    update.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def add(self, operation, instance, committed_at=None):
+        window = settings.TEAM_EVENT_WINDOW / 1000
+        team_id = instance.pk
+        committed_at = committed_at or time.time()
+
+        if operation == DELETED or not window:
+            with self.lock:
+                self.pending.pop(team_id, None)
+                timer = self.timers.pop(team_id, None)
+            if timer:
+                timer.cancel()
+            TeamSubscriptionEvent(operation=operation, instance=instance, committed_at=committed_at).send()
+            return
+
+        with self.lock:
+            first_committed_at = self.pending.get(team_id, (None, None, committed_at))[2]
+            self.pending[team_id] = (operation, instance, first_committed_at)
+            if team_id not in self.timers:
+                timer = threading.Timer(window, self.run, [team_id])
+                self.timers[team_id] = timer
+                timer.start()
+
+    def flush(self, team_id):
+        """Send the pending event of the team, if any."""
+        with self.lock:
+            self.timers.pop(team_id, None)
+            operation, instance, committed_at = self.pending.pop(team_id, (None, None, None))
+        if instance is not None:
+            TeamSubscriptionEvent(operation=operation, instance=instance, committed_at=committed_at).send()
+
+    def run(self, team_id):
+        try:
+            self.flush(team_id)
+        finally:
+            # the timer thread has its own database connection
+            connection.close()
+
+
+team_events = TeamEventCoalescer()
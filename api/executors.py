@@ -0,0 +1,104 @@
+import asyncio
+import contextvars
+import functools
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from django.db import connections
+
+
+class DatabaseExecutor(ThreadPoolExecutor):
+    """
+    Bounded thread pool for database work, with queue depth and wait time.
+
+    Each thread keeps its database connection between calls as long as
+    CONN_MAX_AGE allows, so the number of connections of a process is
+    limited by the number of threads, however many requests are waiting.
+    """
+
+    def __init__(self, max_workers, name):
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+        with self.lock:
+            self.queued += 1
+        return super().submit(self.run, submitted, fn, *args, **kwargs)
+
+    def run(self, submitted, fn, *args, **kwargs):
+        wait = time.perf_counter() - submitted
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self.lock:
+            started = self.completed + self.running
+            return {
+                "threads": self._max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "wait_avg": self.wait_total / started if started else 0.0,
+                "wait_max": self.wait_max,
+            }
+
+
+def check_connections():
+    """Close connections of this thread that the database has dropped."""
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+class DatabaseExecutorSyncToAsync(DatabaseSyncToAsync):
+    """
+    database_sync_to_async that runs in a DatabaseExecutor instead of the
+    default executor of the event loop.
+    """
+
+    def __init__(self, func, executor=None):
+        super().__init__(func)
+        self.executor = executor
+
+    async def __call__(self, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        context = contextvars.copy_context()
+        child = functools.partial(self.func, *args, **kwargs)
+        return await loop.run_in_executor(
+            self.executor or db_executor,
+            functools.partial(self.thread_handler, loop, self.get_current_task(), sys.exc_info(), context.run, child),
+        )
+
+    def thread_handler(self, loop, *args, **kwargs):
+        if settings.DB_HEALTH_CHECKS:
+            check_connections()
+        return super().thread_handler(loop, *args, **kwargs)
+
+
+db_sync_to_async = DatabaseExecutorSyncToAsync
+
+# database work of the websocket consumers and their authentication
+db_executor = DatabaseExecutor(settings.DB_EXECUTOR_THREADS, "db")
+
+# GraphQL requests over HTTP, see api.consumers.GraphQLHttpConsumer
+graphql_executor = DatabaseExecutor(settings.GRAPHQL_HTTP_THREADS, "graphql-http")
@@ -0,0 +1,170 @@
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from api.models import Answer, ArchivedScore, LeaderboardEntry, SCORE_FIELDS, GLOBAL_BOARD, topic_board
+
+
+# rank is the 1-based position on the board
+Ranking = namedtuple("Ranking", ["rank", "user_id", "score"])
+
+
+class LeaderboardBackend:
+    """
+    Rankings read from the LeaderboardEntry table, ordered by score and user id.
+
+    A page is read from the rank index, but the rows before its offset are
+    skipped and the users above a user are counted, so a page or a rank at
+    position n costs O(n). This is fine for boards of a few thousand users,
+    larger boards should use the Redis backend, which answers both in
+    O(log n).
+    """
+
+    def page(self, board, offset, limit):
+        """Return the rankings at positions offset + 1 to offset + limit."""
+        rows = LeaderboardEntry.objects.filter(board=board).order_by("-score", "user_id").values_list(
+            "user_id", "score"
+        )[offset:offset + limit]
+        return [Ranking(offset + i + 1, user_id, score) for i, (user_id, score) in enumerate(rows)]
+
+    def rank(self, board, user_id):
+        """Return the ranking of the user, None if the user has no score on the board."""
+        score = LeaderboardEntry.objects.filter(board=board, user_id=user_id).values_list("score", flat=True).first()
+        if score is None:
+            return None
+        above = LeaderboardEntry.objects.filter(board=board).filter(
+            Q(score__gt=score) | Q(score=score, user_id__lt=user_id)
+        ).count()
+        return Ranking(above + 1, user_id, score)
+
+    def changed(self, boards, removed):
+        """Called after LeaderboardEntry.objects.add_scores or remove_boards."""
+
+    def user_removed(self, user_id):
+        """Called after a user was deleted, its entries are deleted with it."""
+
+    def rebuild(self, batch_size=1000):
+        """
+        Recompute all entries from the scored answers and the archived scores,
+        returns the number of entries.
+        """
+        scores = Counter()
+        answers = Answer.objects.filter(score__gt=0).order_by()
+        for row in answers.values("author_id", "question__topic_id").annotate(points=Sum("score")):
+            scores[row["author_id"], row["question__topic_id"]] += row["points"]
+        archived = ArchivedScore.objects.order_by().values("user_id", "topic_id").annotate(
+            points=Sum(sum(F(field) * score for score, field in SCORE_FIELDS.items() if score))
+        )
+        for row in archived:
+            scores[row["user_id"], row["topic_id"]] += row["points"]
+
+        boards = Counter()
+        for (user_id, topic_id), points in scores.items():
+            if points:
+                boards[GLOBAL_BOARD, user_id] += points
+                boards[topic_board(topic_id), user_id] += points
+        entries = [LeaderboardEntry(board=board, user_id=user_id, score=points) for (board, user_id), points in boards.items()]
+
+        with transaction.atomic():
+            LeaderboardEntry.objects.all().delete()
+            LeaderboardEntry.objects.bulk_create(entries, batch_size=batch_size)
+        return len(entries)
+
+
+class RedisLeaderboardBackend(LeaderboardBackend):
+    """
+    Rankings read from one Redis sorted set per board, which mirrors the
+    LeaderboardEntry table. The changes are applied once their transaction
+    is committed, rebuild() reloads all boards from the table.
+
+    Users with the same score are ordered by user id like in the table: the
+    sorted set score is points * TIE_RANGE plus a tie-break that is larger
+    for smaller user ids. Scores are doubles, so this is exact for user ids
+    below TIE_RANGE and up to 2 ** 22 points.
+    """
+
+    prefix = "leaderboard:"
+    TIE_RANGE = 2 ** 31
+
+    def __init__(self, client):
+        self.client = client
+
+    def key(self, board):
+        return self.prefix + board
+
+    def encode(self, points, user_id):
+        return points * self.TIE_RANGE + self.tie_break(user_id)
+
+    def tie_break(self, user_id):
+        return self.TIE_RANGE - 1 - int(user_id)
+
+    def decode(self, score):
+        return int(score) // self.TIE_RANGE
+
+    def page(self, board, offset, limit):
+        rows = self.client.zrevrange(self.key(board), offset, offset + limit - 1, withscores=True)
+        return [Ranking(offset + i + 1, int(user_id), self.decode(score)) for i, (user_id, score) in enumerate(rows)]
+
+    def rank(self, board, user_id):
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.zrevrank(self.key(board), user_id)
+        pipeline.zscore(self.key(board), user_id)
+        rank, score = pipeline.execute()
+        if rank is None:
+            return None
+        return Ranking(rank + 1, user_id, self.decode(score))
+
+    def changed(self, boards, removed):
+        def apply():
+            pipeline = self.client.pipeline(transaction=False)
+            for board, users in boards.items():
+                for user_id, points in users.items():
+                    # new users start with their tie-break
+                    pipeline.zadd(self.key(board), {user_id: self.tie_break(user_id)}, nx=True)
+                    pipeline.zincrby(self.key(board), points * self.TIE_RANGE, user_id)
+            for board in removed:
+                pipeline.delete(self.key(board))
+            pipeline.execute()
+        transaction.on_commit(apply)
+
+    def user_removed(self, user_id):
+        def apply():
+            pipeline = self.client.pipeline(transaction=False)
+            for key in self.client.scan_iter(self.prefix + "*"):
+                pipeline.zrem(key, user_id)
+            pipeline.execute()
+        transaction.on_commit(apply)
+
+    def rebuild(self, batch_size=1000):
+        count = super().rebuild(batch_size=batch_size)
+
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+        rows = LeaderboardEntry.objects.order_by("pk").values_list("board", "user_id", "score").iterator(batch_size)
+        pipeline = self.client.pipeline(transaction=False)
+        for i, (board, user_id, score) in enumerate(rows, 1):
+            pipeline.zadd(self.key(board), {user_id: self.encode(score, user_id)})
+            if i % batch_size == 0:
+                pipeline.execute()
+        pipeline.execute()
+        return count
+
+
+@lru_cache(maxsize=None)
+def redis_client(url):
+    try:
+        import redis
+    except ImportError:
+        raise ImproperlyConfigured("The redis leaderboard needs the redis package.")
+    return redis.Redis.from_url(url)
+
+
+def get_leaderboard_backend():
+    """Return the leaderboard backend selected by LEADERBOARD_BACKEND."""
+    if settings.LEADERBOARD_BACKEND == "redis":
+        return RedisLeaderboardBackend(redis_client(settings.LEADERBOARD_REDIS_URL))
+    return LeaderboardBackend()
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.http import HttpRequest
+from graphql.error import GraphQLError
+from graphql.language import ast
+from graphql.type import GraphQLObjectType, GraphQLInterfaceType
+from graphql.type.definition import get_named_type
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_credentials
+
+
+class QueryAnalysis:
+    """
+    Depth and estimated cost of a query document, computed from the document
+    and its variables before execution.
+
+    Every field that returns an object costs 1, scalars are free, and
+    GRAPHQL_FIELD_COSTS overrides the cost of single fields ("TeamNode.members").
+    The selection of a connection is counted once per requested item: its
+    first or last argument, else the expected size from
+    GRAPHQL_CONNECTION_SIZES, else GRAPHQL_MAX_PAGE_SIZE.
+    """
+
+    def __init__(self, schema, document_ast, variables=None, operation_name=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+        self.depth = 0
+        self.cost = 0
+
+        operation = get_operation_ast(document_ast, operation_name)
+        if operation is None:
+            return
+        root_type = {
+            "query": schema.get_query_type,
+            "mutation": schema.get_mutation_type,
+            "subscription": schema.get_subscription_type,
+        }[operation.operation]()
+        self.cost = self.selection_cost(operation.selection_set, root_type, 1)
+
+    def selection_cost(self, selection_set, parent_type, depth):
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                cost += self.field_cost(selection, parent_type, depth)
+            elif isinstance(selection, ast.InlineFragment):
+                fragment_type = self.schema.get_type(selection.type_condition.name.value) if selection.type_condition else parent_type
+                cost += self.selection_cost(selection.selection_set, fragment_type, depth)
+            elif isinstance(selection, ast.FragmentSpread):
+                fragment = self.fragments[selection.name.value]
+                cost += self.selection_cost(fragment.selection_set, self.schema.get_type(fragment.type_condition.name.value), depth)
+        return cost
+
+    def field_cost(self, field, parent_type, depth):
+        name = field.name.value
+        if name.startswith("__") or not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)):
+            return 0
+        field_def = parent_type.fields.get(name)
+        if field_def is None:
+            return 0
+
+        self.depth = max(self.depth, depth)
+        field_type = get_named_type(field_def.type)
+        if field.selection_set is None:
+            return settings.GRAPHQL_FIELD_COSTS.get(f"{parent_type.name}.{name}", 0)
+
+        cost = settings.GRAPHQL_FIELD_COSTS.get(f"{parent_type.name}.{name}", 1)
+        children = self.selection_cost(field.selection_set, field_type, depth + 1)
+        if self.is_connection(field_type):
+            children *= self.page_size(field, f"{parent_type.name}.{name}")
+        return cost + children
+
+    @staticmethod
+    def is_connection(field_type):
+        return (
+            isinstance(field_type, GraphQLObjectType)
+            and field_type.name.endswith("Connection")
+            and "edges" in field_type.fields
+        )
+
+    def page_size(self, field, key):
+        for argument in field.arguments or []:
+            if argument.name.value in ("first", "last"):
+                value = argument.value
+                if isinstance(value, ast.Variable):
+                    value = self.variables.get(value.name.value)
+                elif isinstance(value, ast.IntValue):
+                    value = int(value.value)
+                else:
+                    value = None
+                if value is None:
+                    continue
+                if isinstance(value, bool) or not isinstance(value, int):
+                    raise GraphQLError(f"Argument {argument.name.value} of {key} must be an integer.")
+                return max(0, min(value, settings.GRAPHQL_MAX_PAGE_SIZE))
+        return settings.GRAPHQL_CONNECTION_SIZES.get(key, settings.GRAPHQL_MAX_PAGE_SIZE)
+
+
+def context_user(context):
+    """
+    User of the request. JSONWebTokenMiddleware authenticates only when the
+    first field is resolved, so the token is checked here (through the token
+    cache) to apply the limits of the user before execution.
+    """
+    user = getattr(context, "user", None)
+    # only HTTP requests carry a token header, the AttrDict context of a
+    # subscription answers None for every attribute
+    if (user is None or not user.is_authenticated) and isinstance(context, HttpRequest):
+        from qteams.auth import get_user_by_token
+
+        token = get_credentials(context)
+        if token is not None:
+            try:
+                user = get_user_by_token(token, context) or user
+            except JSONWebTokenError:
+                pass
+    return user
+
+
+def query_limits(user):
+    """Return (max depth, max cost) for the user, None means unlimited."""
+    if user is None or not user.is_authenticated:
+        level = "anonymous"
+    elif user.is_staff:
+        level = "staff"
+    else:
+        level = "authenticated"
+    return settings.GRAPHQL_QUERY_LIMITS.get(level) or (None, None)
+
+
+def check_limits(schema, document_ast, context=None, variables=None, operation_name=None):
+    """Return the errors for a query that exceeds the limits of the user of the context."""
+    max_depth, max_cost = query_limits(context_user(context))
+    if max_depth is None and max_cost is None:
+        return []
+
+    try:
+        analysis = QueryAnalysis(schema, document_ast, variables, operation_name)
+    except GraphQLError as error:
+        return [error]
+    errors = []
+    if max_depth is not None and analysis.depth > max_depth:
+        errors.append(GraphQLError(f"Query depth {analysis.depth} exceeds the limit of {max_depth}."))
+    if max_cost is not None and analysis.cost > max_cost:
+        errors.append(GraphQLError(f"Query cost {analysis.cost} exceeds the limit of {max_cost}."))
+    return errors
@@ -0,0 +1,166 @@
+from collections import defaultdict
+
+from promise import Promise
+from promise.dataloader import DataLoader
+from django.contrib.auth.models import User
+from django.db.models import Q, Count
+
+from api.models import Topic, Question, Answer, Membership, UserTopicStats
+
+
+class ModelLoader(DataLoader):
+    """Batch load model instances by primary key."""
+    model = None
+
+    def load(self, key=None):
+        # ids assigned from a global id are strings
+        return super().load(self.model._meta.pk.to_python(key))
+
+    def batch_load_fn(self, keys):
+        objects = self.model.objects.in_bulk(keys)
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+class UserLoader(ModelLoader):
+    model = User
+
+
+class TopicLoader(ModelLoader):
+    model = Topic
+
+
+class QuestionLoader(ModelLoader):
+    model = Question
+
+
+class TeamMembersLoader(DataLoader):
+    """Batch load the members of teams, keyed by team id."""
+
+    def __init__(self, users, **kwargs):
+        super().__init__(**kwargs)
+        self.users = users
+
+    def batch_load_fn(self, keys):
+        members = defaultdict(list)
+        for ms in Membership.objects.filter(team_id__in=keys).select_related("user").order_by("pk"):
+            members[ms.team_id].append(ms.user)
+            self.users.prime(ms.user_id, ms.user)
+        return Promise.resolve([members[key] for key in keys])
+
+
+class TeamMembershipsLoader(DataLoader):
+    """Batch load the memberships of teams, keyed by team id."""
+
+    def batch_load_fn(self, keys):
+        memberships = defaultdict(list)
+        for ms in Membership.objects.filter(team_id__in=keys).order_by("pk"):
+            memberships[ms.team_id].append(ms)
+        return Promise.resolve([memberships[key] for key in keys])
+
+
+class QuestionAnswersLoader(DataLoader):
+    """Batch load the answers of questions, keyed by question id."""
+
+    def batch_load_fn(self, keys):
+        answers = defaultdict(list)
+        for answer in Answer.objects.filter(question_id__in=keys).order_by("pk"):
+            answers[answer.question_id].append(answer)
+        return Promise.resolve([answers[key] for key in keys])
+
+
+class TeamQuestionStatsLoader(DataLoader):
+    """Batch load question count and done count of teams, keyed by team id."""
+
+    def batch_load_fn(self, keys):
+        rows = Question.objects.filter(team_id__in=keys).values("team_id").annotate(
+            question_count=Count("pk"),
+            done_count=Count("pk", filter=Q(done=True)),
+        )
+        stats = {row["team_id"]: row for row in rows}
+        empty = {"question_count": 0, "done_count": 0}
+        return Promise.resolve([stats.get(key, empty) for key in keys])
+
+
+class UserTopicStatsLoader(DataLoader):
+    """Batch load the statistics of users per topic, keyed by user id."""
+
+    def batch_load_fn(self, keys):
+        stats = defaultdict(list)
+        for row in UserTopicStats.objects.filter(user_id__in=keys).order_by("topic_id"):
+            stats[row.user_id].append(row)
+        return Promise.resolve([stats[key] for key in keys])
+
+
+class UserDoneLoader(DataLoader):
+    """Batch load Team.user_done for the requesting user, keyed by team instance."""
+
+    def __init__(self, user, **kwargs):
+        super().__init__(**kwargs)
+        self.user = user
+
+    def batch_load_fn(self, teams):
+        user_id = getattr(self.user, "pk", None)
+
+        question_teams = [team.pk for team in teams if team.state == "question"]
+        answer_questions = [team.current_question_id for team in teams if team.state == "answer" and team.current_question_id]
+
+        asked = set()
+        if question_teams:
+            asked = set(Question.objects.filter(team_id__in=question_teams, author_id=user_id).values_list("team_id", flat=True))
+
+        answered = set()
+        if answer_questions:
+            answered = set(Question.objects.filter(
+                Q(author_id=user_id) | Q(answer__author_id=user_id),
+                pk__in=answer_questions,
+            ).values_list("pk", flat=True))
+
+        result = []
+        for team in teams:
+            if team.state == "question":
+                result.append(team.pk in asked)
+            elif team.state == "answer":
+                result.append(team.current_question_id in answered)
+            else:
+                result.append(None)
+        return Promise.resolve(result)
+
+
+class Loaders:
+    """All data loaders of a single request."""
+
+    def __init__(self, user):
+        self.users = UserLoader()
+        self.topics = TopicLoader()
+        self.questions = QuestionLoader()
+        self.team_members = TeamMembersLoader(self.users)
+        self.team_memberships = TeamMembershipsLoader()
+        self.question_answers = QuestionAnswersLoader()
+        self.team_question_stats = TeamQuestionStatsLoader()
+        self.user_topic_stats = UserTopicStatsLoader()
+        self.user_done = UserDoneLoader(user)
+
+
+def load_related(instance, name, loader):
+    """Return a related object if it was already fetched, otherwise batch load it."""
+    field = instance._meta.get_field(name)
+    if field.is_cached(instance):
+        return getattr(instance, name)
+    key = getattr(instance, field.attname)
+    if key is None:
+        return None
+    return loader.load(key)
+
+
+def get_loaders(info):
+    """Return the data loaders attached to the context, creating them on first use."""
+    loaders = getattr(info.context, "loaders", None)
+    if loaders is None:
+        loaders = Loaders(info.context.user)
+        info.context.loaders = loaders
+    return loaders
+
+
+def reset_loaders(info):
+    """Drop the cached loaders, e.g. before resolving a new subscription event."""
+    info.context.loaders = None
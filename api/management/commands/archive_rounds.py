@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api.models import Team
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the rounds of teams that finished more than --days ago into the archive tables "
+        "and set the teams to archived. Each team is archived in its own transaction, so the "
+        "live tables are only locked for one round at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to wait between batches")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the teams to archive")
+
+    def handle(self, *args, days=30, batch_size=100, sleep=0, dry_run=False, **options):
+        cutoff = timezone.now() - timedelta(days=days)
+        teams = Team.objects.filter(state="done").annotate(
+            last_activity=Coalesce(Max("questions__answer__created_at"), Max("questions__created_at"), "created_at")
+        ).filter(last_activity__lt=cutoff).order_by("pk")
+
+        count = answers = 0
+        last = 0
+        while True:
+            chunk = list(teams.filter(pk__gt=last).values_list("pk", flat=True)[:batch_size])
+            if not chunk:
+                break
+            last = chunk[-1]
+            if dry_run:
+                count += len(chunk)
+                continue
+
+            for team in Team.objects.filter(pk__in=chunk).order_by("pk"):
+                archived = team.archive()
+                if team.state == "archived":
+                    count += 1
+                    answers += archived.answers if archived else 0
+            if sleep:
+                time.sleep(sleep)
+
+        if dry_run:
+            self.stdout.write(f"{count} teams to archive.")
+        else:
+            self.stdout.write(f"{count} teams archived, {answers} answers moved.")
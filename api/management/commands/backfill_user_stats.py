@@ -0,0 +1,95 @@
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Case, When, Sum
+
+from api.models import Question, Answer, ArchivedScore, UserTopicStats, SCORE_FIELDS, STAT_FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the user statistics per topic from the finished questions and the archived "
+        "rounds. The tables are read in short chunks by primary key and the statistics written in "
+        "one small transaction per batch, so no table is locked for long. A question finished while "
+        "the command runs may be counted twice or not at all, running the command again repairs it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to wait between batches")
+
+    def handle(self, *args, batch_size=1000, sleep=0, **options):
+        totals = defaultdict(Counter)
+        questions = Question.objects.filter(done=True).order_by("pk")
+        last = 0
+        while True:
+            chunk = list(questions.filter(pk__gt=last).values_list("pk", "author_id", "topic_id")[:batch_size])
+            if not chunk:
+                break
+            first, last = chunk[0][0] - 1, chunk[-1][0]
+            for pk, author_id, topic_id in chunk:
+                totals[author_id, topic_id]["questions"] += 1
+
+            tallies = Answer.objects.filter(
+                question_id__gt=first, question_id__lte=last, question__done=True
+            ).values("author_id", "question__topic_id").order_by().annotate(
+                answers=Count("pk"),
+                **{field: Count(Case(When(score=score, then="pk"))) for score, field in SCORE_FIELDS.items()},
+            )
+            for row in tallies:
+                totals[row["author_id"], row["question__topic_id"]].update(
+                    {field: row[field] for field in STAT_FIELDS if field != "questions"}
+                )
+            self.pause(sleep)
+
+        # the answers of archived rounds only remain as counts
+        archived = ArchivedScore.objects.order_by().values("user_id", "topic_id").annotate(
+            **{f"{field}_sum": Sum(field) for field in STAT_FIELDS if field != "questions"}
+        )
+        for row in archived:
+            totals[row["user_id"], row["topic_id"]].update(
+                {field: row[f"{field}_sum"] for field in STAT_FIELDS if field != "questions"}
+            )
+
+        # overwrite or remove the existing rows, then add the missing ones
+        rows = UserTopicStats.objects.order_by("pk")
+        seen = set()
+        updated = removed = 0
+        last = 0
+        while True:
+            chunk = list(rows.filter(pk__gt=last)[:batch_size])
+            if not chunk:
+                break
+            last = chunk[-1].pk
+            kept, stale = [], []
+            for stats in chunk:
+                key = (stats.user_id, stats.topic_id)
+                seen.add(key)
+                if key in totals:
+                    for field in STAT_FIELDS:
+                        setattr(stats, field, totals[key][field])
+                    kept.append(stats)
+                else:
+                    stale.append(stats.pk)
+            with transaction.atomic():
+                UserTopicStats.objects.bulk_update(kept, STAT_FIELDS)
+                UserTopicStats.objects.filter(pk__in=stale).delete()
+            updated += len(kept)
+            removed += len(stale)
+            self.pause(sleep)
+
+        missing = [
+            UserTopicStats(user_id=user_id, topic_id=topic_id, **counts)
+            for (user_id, topic_id), counts in totals.items() if (user_id, topic_id) not in seen
+        ]
+        for i in range(0, len(missing), batch_size):
+            UserTopicStats.objects.bulk_create(missing[i:i + batch_size], ignore_conflicts=True)
+            self.pause(sleep)
+
+        self.stdout.write(f"{updated} user statistics updated, {len(missing)} created, {removed} removed.")
+
+    def pause(self, sleep):
+        if sleep:
+            time.sleep(sleep)
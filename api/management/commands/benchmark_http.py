@@ -0,0 +1,64 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.testing import HttpCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+
+from qteams.routing import application
+
+
+DEFAULT_QUERY = "query { topics { edges { node { code name questionCount } } } }"
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the same GraphQL request many times through the WSGI handler and through the "
+        "ASGI application, with the given number of requests in flight, and compare requests/sec."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--query", default=DEFAULT_QUERY)
+
+    def handle(self, *args, requests=500, concurrency=50, query=DEFAULT_QUERY, **options):
+        body = json.dumps({"query": query}).encode("utf-8")
+
+        for name, run in (("wsgi", self.run_wsgi), ("asgi", self.run_asgi)):
+            start = time.perf_counter()
+            statuses = run(body, requests, concurrency)
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for status in statuses if status != 200)
+            if failed:
+                raise CommandError(f"{name}: {failed} of {requests} requests failed")
+            self.stdout.write(f"{name}: {requests} requests in {elapsed:.2f} s, {requests / elapsed:.0f} requests/sec")
+
+    def run_wsgi(self, body, requests, concurrency):
+        """Like a threaded WSGI server: one worker thread per request in flight."""
+        def post(i):
+            response = Client(HTTP_HOST="localhost").post("/", body, content_type="application/json")
+            connections.close_all()
+            return response.status_code
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(post, range(requests)))
+
+    def run_asgi(self, body, requests, concurrency):
+        async def post(semaphore):
+            async with semaphore:
+                communicator = HttpCommunicator(
+                    application, "POST", "/", body=body,
+                    headers=[(b"host", b"localhost"), (b"content-type", b"application/json")],
+                )
+                response = await communicator.get_response(timeout=60)
+                return response["status"]
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(post(semaphore) for i in range(requests)))
+
+        return asyncio.run(run())
@@ -0,0 +1,73 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from api.models import Topic, Question
+from api.search import get_search_backend
+
+
+WORDS = (
+    "Ableitung Integral Matrix Vektor Grenzwert Funktion Menge Relation Graph Baum "
+    "Algorithmus Komplexität Rekursion Schleife Variable Objekt Klasse Vererbung Schnittstelle "
+    "Datenbank Tabelle Index Transaktion Normalform Netzwerk Protokoll Schicht Paket Adresse"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill a benchmark topic with generated questions and compare full-text search with icontains. "
+        "The generated data is removed afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=500000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--keep", action="store_true", help="Keep the generated questions")
+
+    def handle(self, *args, questions=500000, batch_size=5000, repeat=5, keep=False, **options):
+        backend = get_search_backend()
+        topic, created = Topic.objects.get_or_create(code="BENCH", defaults={"name": "Benchmark"})
+        author, created = User.objects.get_or_create(username="benchmark")
+
+        existing = Question.objects.filter(topic=topic).count()
+        if existing < questions:
+            self.stdout.write(f"Generating {questions - existing} questions...")
+            rng = random.Random(0)
+            for start in range(existing, questions, batch_size):
+                with transaction.atomic():
+                    Question.objects.bulk_create([
+                        Question(
+                            author=author,
+                            topic=topic,
+                            question=" ".join(rng.choices(WORDS, k=12)),
+                            model_answer=" ".join(rng.choices(WORDS, k=30)),
+                        )
+                        for i in range(start, min(start + batch_size, questions))
+                    ])
+            # bulk_create does not send signals
+            backend.rebuild(batch_size=batch_size)
+
+        queryset = Question.objects.filter(topic=topic)
+        for value in ("Rekursion", "Daten", "Matrix Vektor", "Normalform Transaktion Index"):
+            fulltext = self.measure(lambda: list(backend.search(queryset, value)[:20]), repeat)
+            icontains = self.measure(lambda: list(
+                queryset.filter(Q(question__icontains=value) | Q(model_answer__icontains=value)).distinct()[:20]
+            ), repeat)
+            self.stdout.write(f"{value!r}: full-text {fulltext * 1000:.1f} ms, icontains {icontains * 1000:.1f} ms")
+
+        if not keep:
+            queryset.delete()
+
+    def measure(self, run, repeat):
+        """Best time of several runs, in seconds."""
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,367 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import socket
+import struct
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from graphql_relay import to_global_id
+
+from api.models import Topic, Team
+
+
+DAPHNE = "from daphne.cli import CommandLineInterface; CommandLineInterface.entrypoint()"
+
+TOKEN_AUTH = """
+mutation TokenAuth($username: String!, $password: String!) {
+    tokenAuth(input: {username: $username, password: $password}) { token }
+}
+"""
+CREATE_TEAM = """
+mutation CreateTeam($name: String!, $topicId: ID!) { createTeam(input: {name: $name, topicId: $topicId}) { team { id } } }
+"""
+ADD_MEMBER = """
+mutation AddMember($teamId: ID!, $username: String!) { addMember(input: {teamId: $teamId, username: $username}) { team { id } } }
+"""
+NEXT_PHASE = """
+mutation NextPhase($id: ID!) { nextPhase(input: {id: $id}) { team { state } } }
+"""
+POST_QUESTION = """
+mutation PostQuestion($id: ID!) { postQuestion(input: {id: $id, question: "Frage", modelAnswer: "Antwort"}) { team { state } } }
+"""
+POST_ANSWER = """
+mutation PostAnswer($id: ID!) { postAnswer(input: {id: $id, answer: "Antwort"}) { team { state } } }
+"""
+SCORE_ANSWERS = """
+mutation ScoreAnswers($scores: [AnswerScoreInput!]!) { scoreAnswers(input: {scores: $scores}) { team { state } } }
+"""
+TEAM = """
+query Team($id: ID!) {
+    team(id: $id) {
+        state
+        currentQuestion { author { username } answerSet { edges { node { id } } } }
+    }
+}
+"""
+TEAM_UPDATED = """
+subscription TeamUpdated($id: ID!) { teamUpdated(id: $id) { state questionNumber } }
+"""
+# operation names reported by /metrics/ of the started server
+OPERATIONS = ["TokenAuth", "CreateTeam", "AddMember", "NextPhase", "PostQuestion", "PostAnswer", "ScoreAnswers", "Team"]
+
+
+def percentiles(values):
+    """p50, p95 and p99 of the values in milliseconds."""
+    if not values:
+        return "-"
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))] * 1000
+    return f"p50 {pick(0.5):.1f} ms, p95 {pick(0.95):.1f} ms, p99 {pick(0.99):.1f} ms"
+
+
+class WebSocket:
+    """
+    Minimal graphql-ws client on asyncio streams. autobahn cannot be used
+    with asyncio here, daphne already selected its twisted flavour.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port, path):
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        writer.write((
+            f"GET {path} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\nSec-WebSocket-Protocol: graphql-ws\r\n\r\n"
+        ).encode("ascii"))
+        response = await reader.readuntil(b"\r\n\r\n")
+        if not response.startswith(b"HTTP/1.1 101"):
+            writer.close()
+            raise ConnectionError(response.split(b"\r\n", 1)[0].decode("latin-1"))
+        return cls(reader, writer)
+
+    def send(self, message, opcode=0x1):
+        payload = json.dumps(message).encode("utf-8") if message is not None else b""
+        mask = os.urandom(4)
+        if len(payload) < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | len(payload))
+        elif len(payload) < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, len(payload))
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, len(payload))
+        self.writer.write(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    async def receive(self):
+        """Return the next text message, None when the connection is closed."""
+        while True:
+            first, second = await self.reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack("!H", await self.reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack("!Q", await self.reader.readexactly(8))
+            payload = await self.reader.readexactly(length)
+            opcode = first & 0x0F
+            if opcode == 0x8:
+                return None
+            if opcode == 0x1:
+                return json.loads(payload)
+
+    def close(self):
+        try:
+            self.send(None, opcode=0x8)
+        finally:
+            self.writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Play full quiz rounds with many teams against a daphne server: create teams through the "
+        "mutations, keep a teamUpdated subscription open for every member and report mutation "
+        "latencies, queries per mutation and event delivery lag. The lag is counted from the commit "
+        "time that the server sends with each event, so with --url the clocks of the server and this "
+        "machine must agree. Starts its own daphne, with profiling enabled, unless --url is given. "
+        "The generated users and teams are removed afterwards unless --keep is given. "
+        "With SQLite, concurrent writes fail with 'database is locked', --http-concurrency 1 plays the "
+        "rounds one request at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--teams", type=int, default=10)
+        parser.add_argument("--members", type=int, default=4)
+        parser.add_argument("--url", help="URL of a running server, e.g. http://localhost:8000/")
+        parser.add_argument("--http-concurrency", type=int, default=50, help="HTTP requests in flight")
+        parser.add_argument("--metrics-token", help="Bearer token for /metrics/, if DEBUG is off on the server")
+        parser.add_argument("--keep", action="store_true", help="Keep the generated users and teams")
+
+    def handle(self, *args, teams=10, members=4, url=None, http_concurrency=50, metrics_token=None,
+               keep=False, **options):
+        if members < 2:
+            raise CommandError("A team needs at least 2 members.")
+
+        self.run_id = uuid.uuid4().hex[:8]
+        self.metrics_token = metrics_token
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.first_errors = {}
+        self.lags = []
+        self.events = 0
+        self.http = ThreadPoolExecutor(max_workers=http_concurrency)
+
+        topic, created = Topic.objects.get_or_create(code="LOAD", defaults={"name": "Lasttest"})
+        self.topic_id = to_global_id("TopicNode", topic.pk)
+        password = uuid.uuid4().hex
+        usernames = [[f"load-{self.run_id}-{t}-{m}" for m in range(members)] for t in range(teams)]
+        hashed = make_password(password)
+        User.objects.bulk_create([User(username=name, password=hashed) for names in usernames for name in names])
+
+        server = None
+        try:
+            if url is None:
+                server, url = self.start_daphne()
+            self.url = url
+
+            before = self.operation_metrics()
+            start = time.perf_counter()
+            asyncio.run(self.run(usernames, password))
+            elapsed = time.perf_counter() - start
+            after = self.operation_metrics()
+        finally:
+            self.http.shutdown()
+            if server is not None:
+                server.terminate()
+                server.wait()
+            if not keep:
+                Team.objects.filter(name__startswith=f"load-{self.run_id}-").delete()
+                User.objects.filter(username__startswith=f"load-{self.run_id}-").delete()
+
+        self.report(teams, elapsed, before, after)
+
+    def start_daphne(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "qteams.settings"),
+            QTEAMS_GRAPHQL_PROFILING="1",
+            QTEAMS_GRAPHQL_PROFILED_OPERATIONS=",".join(OPERATIONS),
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-c", DAPHNE, "-b", "127.0.0.1", "-p", str(port), "qteams.asgi:application"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return server, f"http://localhost:{port}/"
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("daphne did not start.")
+
+    def request(self, body, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"JWT {token}"
+        request = urllib.request.Request(self.url, data=json.dumps(body).encode("utf-8"), headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read())
+
+    async def post(self, name, query, variables, token=None):
+        """Run a query over HTTP, record its latency and return its data, None on errors."""
+        start = time.perf_counter()
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(self.http, self.request, {"query": query, "variables": variables}, token)
+        self.latencies[name].append(time.perf_counter() - start)
+        if result.get("errors"):
+            self.errors[name] += 1
+            self.first_errors.setdefault(name, result["errors"][0]["message"])
+            return None
+        return result["data"]
+
+    async def subscribe(self, token, team_id):
+        location = urlsplit(self.url)
+        websocket = await WebSocket.connect(location.hostname, location.port or 80, f"{location.path}?auth={token}")
+        websocket.send({
+            "id": "1",
+            "type": "start",
+            "payload": {"query": TEAM_UPDATED, "variables": {"id": team_id}},
+        })
+        return websocket, asyncio.ensure_future(self.listen(websocket))
+
+    async def listen(self, websocket):
+        try:
+            while True:
+                message = await websocket.receive()
+                if message is None:
+                    return
+                if message.get("type") == "data":
+                    self.events += 1
+                    committed_at = (message["payload"].get("extensions") or {}).get("committedAt")
+                    if committed_at is not None:
+                        self.lags.append(time.time() - committed_at)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def run(self, usernames, password):
+        tokens = {}
+        for names in usernames:
+            results = await asyncio.gather(*(
+                self.post("TokenAuth", TOKEN_AUTH, {"username": name, "password": password}) for name in names
+            ))
+            for name, data in zip(names, results):
+                if data is None:
+                    raise CommandError(f"Could not log in as {name}.")
+                tokens[name] = data["tokenAuth"]["token"]
+
+        await asyncio.gather(*(self.play(t, names, tokens) for t, names in enumerate(usernames)))
+
+    async def play(self, number, names, tokens):
+        """Create a team and play one round with a question from every member."""
+        creator = names[0]
+        data = await self.post(
+            "CreateTeam", CREATE_TEAM, {"name": f"load-{self.run_id}-{number}", "topicId": self.topic_id},
+            tokens[creator],
+        )
+        if data is None:
+            return
+        team_id = data["createTeam"]["team"]["id"]
+        for name in names[1:]:
+            await self.post("AddMember", ADD_MEMBER, {"teamId": team_id, "username": name}, tokens[creator])
+
+        sockets = await asyncio.gather(*(self.subscribe(tokens[name], team_id) for name in names))
+        # let the subscriptions join their groups
+        await asyncio.sleep(0.5)
+
+        try:
+            await self.post("NextPhase", NEXT_PHASE, {"id": team_id}, tokens[creator])
+            await asyncio.gather(*(
+                self.post("PostQuestion", POST_QUESTION, {"id": team_id}, tokens[name]) for name in names
+            ))
+
+            for _ in names:
+                data = await self.post("Team", TEAM, {"id": team_id}, tokens[creator])
+                if data is None or data["team"]["state"].lower() != "answer":
+                    break
+                author = data["team"]["currentQuestion"]["author"]["username"]
+
+                await asyncio.gather(*(
+                    self.post("PostAnswer", POST_ANSWER, {"id": team_id}, tokens[name])
+                    for name in names if name != author
+                ))
+                data = await self.post("Team", TEAM, {"id": team_id}, tokens[author])
+                if data is None:
+                    break
+                scores = [
+                    {"id": edge["node"]["id"], "score": random.choice(["RIGHT", "PARTIAL", "WRONG"])}
+                    for edge in data["team"]["currentQuestion"]["answerSet"]["edges"]
+                ]
+                await self.post("ScoreAnswers", SCORE_ANSWERS, {"scores": scores}, tokens[author])
+                await self.post("NextPhase", NEXT_PHASE, {"id": team_id}, tokens[author])
+
+            # wait for the last events
+            await asyncio.sleep(0.5)
+        finally:
+            for websocket, listener in sockets:
+                listener.cancel()
+                websocket.close()
+
+    def operation_metrics(self):
+        """{operation: (query sum, count)} from the /metrics/ endpoint of the server."""
+        request = urllib.request.Request(self.url.rstrip("/") + "/metrics/")
+        if self.metrics_token:
+            request.add_header("Authorization", f"Bearer {self.metrics_token}")
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                text = response.read().decode("utf-8")
+        except urllib.error.URLError:
+            return None
+
+        values = defaultdict(lambda: [0, 0])
+        for kind, operation, value in re.findall(
+            r'^graphql_operation_queries_(sum|count)\{operation="([^"]*)"\} (\S+)$', text, re.MULTILINE
+        ):
+            values[operation][0 if kind == "sum" else 1] = float(value)
+        return values
+
+    def report(self, teams, elapsed, before, after):
+        requests = sum(len(values) for values in self.latencies.values())
+        self.stdout.write(f"{teams} teams in {elapsed:.1f} s, {requests / elapsed:.0f} requests/sec")
+        for name, values in sorted(self.latencies.items()):
+            line = f"{name}: {len(values)} requests, {self.errors[name]} errors, {percentiles(values)}"
+            if before is not None and after is not None:
+                queries = after[name][0] - before[name][0]
+                count = after[name][1] - before[name][1]
+                if count:
+                    line += f", {queries / count:.1f} queries"
+            self.stdout.write(line)
+            if name in self.first_errors:
+                self.stdout.write(f"    first error: {self.first_errors[name]}")
+        self.stdout.write(f"teamUpdated: {self.events} events, lag since commit {percentiles(self.lags)}")
+        if before is None:
+            self.stdout.write("No query counts, /metrics/ is not reachable (see --metrics-token).")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.leaderboard import get_leaderboard_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the leaderboards from the scored and archived answers, e.g. after answers were changed "
+        "in the admin or questions moved to another topic, and reload the Redis boards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size=1000, **options):
+        backend = get_leaderboard_backend()
+        count = backend.rebuild(batch_size=batch_size)
+        self.stdout.write(f"{count} leaderboard entries rebuilt with {backend.__class__.__name__}.")
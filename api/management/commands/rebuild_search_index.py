@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text index of the questions, e.g. after bulk imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size=1000, **options):
+        backend = get_search_backend()
+        count = backend.rebuild(batch_size=batch_size)
+        self.stdout.write(f"{count} questions indexed with {backend.__class__.__name__}.")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Case, When
+
+from api.models import Answer, Membership, SCORE_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Verify the score counters of all memberships against the scored answers and repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--team", type=int, action="append", dest="teams", help="Only check this team (repeatable)")
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without repairing it")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, teams=None, dry_run=False, batch_size=500, **options):
+        answers = Answer.objects.filter(question__team__isnull=False)
+        memberships = Membership.objects.order_by("pk")
+        if teams:
+            answers = answers.filter(question__team__in=teams)
+            memberships = memberships.filter(team__in=teams)
+
+        # one grouped aggregate for all (author, team) pairs
+        tallies = answers.values("author", "question__team").order_by().annotate(**{
+            field: Count(Case(When(score=score, then="pk")))
+            for score, field in SCORE_FIELDS.items()
+        })
+        expected = {(row["author"], row["question__team"]): row for row in tallies}
+
+        fields = list(SCORE_FIELDS.values())
+        checked = 0
+        drifted = []
+        for ms in memberships.iterator(chunk_size=batch_size):
+            checked += 1
+            row = expected.get((ms.user_id, ms.team_id), {})
+            if any(getattr(ms, field) != row.get(field, 0) for field in fields):
+                for field in fields:
+                    setattr(ms, field, row.get(field, 0))
+                drifted.append(ms)
+
+        if drifted and not dry_run:
+            with transaction.atomic():
+                Membership.objects.bulk_update(drifted, fields, batch_size=batch_size)
+
+        self.stdout.write(
+            f"{checked} memberships checked, {len(drifted)} "
+            f"{'drifted' if dry_run else 'repaired'}."
+        )
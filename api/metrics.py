@@ -0,0 +1,177 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from graphql.type import GraphQLEnumType, GraphQLScalarType
+from graphql.type.definition import get_named_type
+from promise import Promise
+
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus histogram with one series per label value."""
+
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self.lock:
+            counts, total = self.series.get(label_value, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.series[label_value] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted(self.series.items())
+        for label_value, (counts, total) in series:
+            label = '{}="{}"'.format(self.label, label_value.replace("\\", "\\\\").replace('"', '\\"'))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return "\n".join(lines)
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+class Metrics:
+    """Resolver and operation timings of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.field_duration = Histogram(
+            "graphql_field_duration_seconds", "Time spent resolving a field.", "path", DURATION_BUCKETS
+        )
+        self.field_queries = Histogram(
+            "graphql_field_queries", "Database queries run while resolving a field.", "path", QUERY_BUCKETS
+        )
+        self.operation_duration = Histogram(
+            "graphql_operation_duration_seconds", "Time spent executing an operation.", "operation", DURATION_BUCKETS
+        )
+        self.operation_queries = Histogram(
+            "graphql_operation_queries", "Database queries run by an operation.", "operation", QUERY_BUCKETS
+        )
+
+    def histograms(self):
+        return [self.field_duration, self.field_queries, self.operation_duration, self.operation_queries]
+
+    def render(self, gauges=None):
+        """Return all histograms, and the given {name: value} gauges, as Prometheus text."""
+        parts = [histogram.render() for histogram in self.histograms()]
+        for name, value in sorted((gauges or {}).items()):
+            parts.append(f"# TYPE {name} gauge\n{name} {value}")
+        return "\n".join(parts) + "\n"
+
+    def clear(self):
+        for histogram in self.histograms():
+            histogram.clear()
+
+
+metrics = Metrics()
+
+
+class QueryCounter:
+    """Database execute wrapper that counts the queries run while it is installed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def field_path(info):
+    """Parent type and name of the field, e.g. TeamNode.members."""
+    return f"{info.parent_type.name}.{info.field_name}"
+
+
+def operation_name_of(operation_name, document_ast):
+    if operation_name:
+        return operation_name
+    for definition in document_ast.definitions:
+        if getattr(definition, "operation", None):
+            return definition.name.value if definition.name else f"anonymous {definition.operation}"
+    return "unknown"
+
+
+def operation_label(name):
+    """
+    Label of an operation in the histograms. Clients choose the operation
+    names, so only those in GRAPHQL_PROFILED_OPERATIONS get their own series
+    and all others are counted as "other".
+    """
+    return name if name in settings.GRAPHQL_PROFILED_OPERATIONS else "other"
+
+
+class ProfilingMiddleware:
+    """
+    Graphene middleware that records the time and the number of queries of
+    every resolver in api.metrics.metrics.
+
+    Fields that return a scalar and run no query are not recorded, they would
+    only add noise. The queries of data loaders run when their batch is
+    dispatched, so for fields resolved through a loader the time until the
+    value arrives is recorded, but the batch query is not counted.
+
+    If the request has a ``graphql_profile`` list (see
+    PersistedQueryGraphQLView), the timings are added to it as well.
+    """
+
+    def resolve(self, next, root, info, **args):
+        if not settings.GRAPHQL_PROFILING:
+            return next(root, info, **args)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            result = next(root, info, **args)
+
+        if Promise.is_thenable(result):
+            return result.then(lambda value: self.record(info, start, counter.count, value))
+        return self.record(info, start, counter.count, result)
+
+    def record(self, info, start, queries, value):
+        duration = time.perf_counter() - start
+        if queries or not isinstance(get_named_type(info.return_type), (GraphQLScalarType, GraphQLEnumType)):
+            path = field_path(info)
+            metrics.field_duration.observe(path, duration)
+            metrics.field_queries.observe(path, queries)
+
+            profile = getattr(info.context, "graphql_profile", None)
+            if profile is not None:
+                profile.append({"path": info.path, "duration": round(duration * 1000, 3), "queries": queries})
+        return value
+
+
+def profile_operation(execute, operation_name, document_ast, context=None):
+    """Run execute() and record the time and queries of the whole operation."""
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        result = execute()
+    duration = time.perf_counter() - start
+
+    name = operation_name_of(operation_name, document_ast)
+    metrics.operation_duration.observe(operation_label(name), duration)
+    metrics.operation_queries.observe(operation_label(name), counter.count)
+
+    if getattr(context, "graphql_profile", None) is not None:
+        context.graphql_operation = {
+            "operation": name, "duration": round(duration * 1000, 3), "queries": counter.count,
+        }
+    return result
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE api_question_search USING fts5(question, model_answer, prefix='2 3')"
+        )
+        schema_editor.execute(
+            "INSERT INTO api_question_search (rowid, question, model_answer) "
+            "SELECT id, question, model_answer FROM api_question"
+        )
+    elif vendor == "mysql":
+        schema_editor.execute(
+            "ALTER TABLE api_question ADD FULLTEXT INDEX api_question_search (question, model_answer)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute("DROP TABLE api_question_search")
+    elif vendor == "mysql":
+        schema_editor.execute("ALTER TABLE api_question DROP INDEX api_question_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_auto_20200517_2137'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.5 on 2026-10-18 20:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_questions(apps, schema_editor):
+    Topic = apps.get_model("api", "Topic")
+    Question = apps.get_model("api", "Question")
+    counts = Question.objects.filter(topic=OuterRef("pk")).order_by().values("topic").annotate(count=Count("pk")).values("count")
+    Topic.objects.update(question_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_question_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='question_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Anzahl Fragen'),
+        ),
+        migrations.RunPython(count_questions, migrations.RunPython.noop),
+    ]
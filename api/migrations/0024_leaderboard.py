@@ -0,0 +1,53 @@
+# Generated by Django 3.0.5 on 2026-10-18 20:46
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_leaderboards(apps, schema_editor):
+    Answer = apps.get_model("api", "Answer")
+    LeaderboardEntry = apps.get_model("api", "LeaderboardEntry")
+    answers = Answer.objects.filter(score__gt=0).order_by()
+    entries = [
+        LeaderboardEntry(board="global", user_id=row["author_id"], score=row["points"])
+        for row in answers.values("author_id").annotate(points=Sum("score"))
+    ] + [
+        LeaderboardEntry(board=f"topic:{row['question__topic_id']}", user_id=row["author_id"], score=row["points"])
+        for row in answers.values("author_id", "question__topic_id").annotate(points=Sum("score"))
+    ]
+    LeaderboardEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0023_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=30, verbose_name='Rangliste')),
+                ('score', models.IntegerField(default=0, verbose_name='Punkte')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Ranglisteneintrag',
+                'verbose_name_plural': 'Ranglisteneinträge',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['board', '-score', 'user'], name='leaderboard_rank_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaderboardentry',
+            unique_together={('board', 'user')},
+        ),
+        migrations.RunPython(fill_leaderboards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.0.5 on 2026-10-18 20:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0024_leaderboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTopicStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.IntegerField(default=0, verbose_name='Antworten')),
+                ('right', models.IntegerField(default=0, verbose_name='richtig')),
+                ('partial', models.IntegerField(default=0, verbose_name='tlw. richtig')),
+                ('wrong', models.IntegerField(default=0, verbose_name='falsch')),
+                ('questions', models.IntegerField(default=0, verbose_name='Fragen')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Topic', verbose_name='Thema')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='topic_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Statistik',
+                'verbose_name_plural': 'Statistiken',
+                'unique_together': {('user', 'topic')},
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.0.5 on 2026-10-18 20:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0025_user_topic_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRound',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('questions', models.PositiveIntegerField(default=0, verbose_name='Fragen')),
+                ('answers', models.PositiveIntegerField(default=0, verbose_name='Antworten')),
+                ('data', models.BinaryField(verbose_name='Daten')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Archiviert am')),
+                ('team', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_rounds', to='api.Team')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Topic', verbose_name='Thema')),
+            ],
+            options={
+                'verbose_name': 'Archivierte Runde',
+                'verbose_name_plural': 'Archivierte Runden',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.PositiveIntegerField(default=0, verbose_name='Antworten')),
+                ('right', models.PositiveIntegerField(default=0, verbose_name='richtig')),
+                ('partial', models.PositiveIntegerField(default=0, verbose_name='tlw. richtig')),
+                ('wrong', models.PositiveIntegerField(default=0, verbose_name='falsch')),
+                ('round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='api.ArchivedRound')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Topic', verbose_name='Thema')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Archivierte Bewertung',
+                'verbose_name_plural': 'Archivierte Bewertungen',
+            },
+        ),
+    ]
@@ -1,10 +1,28 @@
-from django.db import models
-from django.db.models import Sum
+import json
+import zlib
+from collections import Counter, defaultdict
+
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, transaction
+from django.dispatch import Signal
+from django.db.models import Sum, Q, F, Count, Case, When, Exists, OuterRef, Value, NullBooleanField
 
 # Create your models here.
+class TopicQuerySet(models.QuerySet):
+    def add_question_counts(self, deltas):
+        """Move the stored question counters by the given {topic_id: delta}."""
+        for topic_id, delta in deltas.items():
+            if topic_id is not None and delta:
+                self.filter(pk=topic_id).update(question_count=F("question_count") + delta)
+
 class Topic(models.Model):
     name = models.CharField("Name", max_length=100)
     code = models.CharField("Code", max_length=20, unique=True)
+    # maintained by api.signals and QuestionQuerySet
+    question_count = models.PositiveIntegerField("Anzahl Fragen", default=0, db_index=True, editable=False)
+
+    objects = TopicQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.code} {self.name}"
@@ -15,6 +33,39 @@ class Topic(models.Model):
 
         ordering = ("code",)
 
+class QuestionQuerySet(models.QuerySet):
+    """Keeps Topic.question_count correct for bulk operations that skip the signals."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic():
+            objs = super().bulk_create(objs, *args, **kwargs)
+            Topic.objects.add_question_counts(Counter(obj.topic_id for obj in objs))
+        return objs
+
+    def update(self, **kwargs):
+        topic_id = kwargs.get("topic_id", kwargs.get("topic"))
+        if topic_id is None:
+            return super().update(**kwargs)
+
+        topic_id = getattr(topic_id, "pk", topic_id)
+        with transaction.atomic():
+            old_topic_ids = dict(self.select_for_update().values_list("pk", "topic_id"))
+            rows = super().update(**kwargs)
+            if hasattr(topic_id, "resolve_expression"):
+                # an expression (bulk_update sends Case/When) gives each row its own topic
+                new_topic_ids = dict(
+                    Question.objects.filter(pk__in=old_topic_ids).values_list("pk", "topic_id")
+                )
+            else:
+                new_topic_ids = dict.fromkeys(old_topic_ids, topic_id)
+
+            deltas = Counter()
+            for pk, old_topic_id in old_topic_ids.items():
+                deltas[old_topic_id] -= 1
+                deltas[new_topic_ids[pk]] += 1
+            Topic.objects.add_question_counts(deltas)
+        return rows
+
 class Question(models.Model):
     team = models.ForeignKey("Team", null=True, blank=True, on_delete=models.SET_NULL, related_name="questions")
     author = models.ForeignKey("auth.User", verbose_name="Autor", on_delete=models.CASCADE)
@@ -27,6 +78,16 @@ class Question(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now_add=True)
 
+    objects = QuestionQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the topic to move the counters if it changes, and the
+        # text to reindex it for search only if that changes
+        instance._loaded_topic_id = instance.__dict__.get("topic_id")
+        instance._loaded_text = (instance.__dict__.get("question"), instance.__dict__.get("model_answer"))
+        return instance
 
     def __str__(self):
         return self.question
@@ -35,13 +96,82 @@ class Question(models.Model):
         verbose_name = "Frage"
         verbose_name_plural = "Fragen"
 
+        # the unique index also serves lookups of the question of a user in a team
         unique_together = ("team", "author")
+        indexes = [
+            # question counts and the next open question of a team
+            models.Index(fields=["team", "done"], name="question_team_done_idx"),
+        ]
 
 SCORE_CHOICES = (
     (0, "falsch"),
     (1, "teilweise richtig"),
     (3, "richtig")
 )
+# Membership counter for each score
+SCORE_FIELDS = {
+    0: "wrong",
+    1: "partial",
+    3: "right",
+}
+class AnswerQuerySet(models.QuerySet):
+    def set_scores(self, scores, scorer):
+        """
+        Score several answers to one question at once, scores maps answer
+        ids to scores. Only the author of the question may score.
+
+        The scores are written with one bulk update and the membership
+        counters of all authors with one UPDATE. Returns the answers.
+        """
+        with transaction.atomic():
+            answers = list(self.select_for_update().select_related("question__team").filter(pk__in=scores))
+            if len(answers) != len(scores):
+                raise Answer.DoesNotExist("Answer matching query does not exist.")
+            if not answers:
+                return answers
+
+            question = answers[0].question
+            if any(answer.question_id != question.pk for answer in answers):
+                raise PermissionDenied("Alle Antworten müssen zur selben Frage gehören.")
+            if question.author_id != scorer.pk:
+                raise PermissionDenied("Du musst Fragesteller sein, um diese Antwort zu bewerten.")
+
+            deltas = {field: Counter() for field in SCORE_FIELDS.values()}
+            points = Counter()
+            for answer in answers:
+                score = scores[answer.pk]
+                if answer.score == score:
+                    continue
+                if answer.score is not None:
+                    deltas[SCORE_FIELDS[answer.score]][answer.author_id] -= 1
+                if score is not None:
+                    deltas[SCORE_FIELDS[score]][answer.author_id] += 1
+                points[(answer.author_id, question.topic_id)] += (score or 0) - (answer.score or 0)
+                answer.score = score
+
+            self.model.objects.bulk_update(answers, ["score"])
+
+            update = {
+                field: F(field) + Case(
+                    *[When(user_id=user_id, then=Value(delta)) for user_id, delta in counts.items() if delta],
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )
+                for field, counts in deltas.items()
+                if any(counts.values())
+            }
+            if update:
+                Membership.objects.filter(team_id=question.team_id, user_id__in={a.author_id for a in answers}).update(**update)
+            LeaderboardEntry.objects.add_scores(points)
+            if question.done:
+                # the statistics of finished questions are already counted
+                stats = defaultdict(Counter)
+                for field, counts in deltas.items():
+                    for user_id, delta in counts.items():
+                        stats[user_id][field] += delta
+                UserTopicStats.objects.add_counts(question.topic_id, stats)
+        return answers
+
 class Answer(models.Model):
     author = models.ForeignKey("auth.User", verbose_name="Autor", on_delete=models.CASCADE)
     question = models.ForeignKey("Question", verbose_name="Frage", on_delete=models.CASCADE)
@@ -50,6 +180,34 @@ class Answer(models.Model):
 
     created_at = models.DateTimeField("Erstellt am", auto_now_add=True)
 
+    objects = AnswerQuerySet.as_manager()
+
+    def set_score(self, score):
+        """Score the answer and move the author's membership counters by the difference."""
+        with transaction.atomic():
+            old_score, done = Answer.objects.select_for_update().values_list("score", "question__done").get(pk=self.pk)
+            self.score = score
+            self.save(update_fields=["score"])
+
+            if old_score == score:
+                return
+
+            delta = Counter()
+            if old_score is not None:
+                delta[SCORE_FIELDS[old_score]] -= 1
+            if score is not None:
+                delta[SCORE_FIELDS[score]] += 1
+
+            Membership.objects.filter(user_id=self.author_id, team_id=self.question.team_id).update(
+                **{field: F(field) + value for field, value in delta.items()}
+            )
+            LeaderboardEntry.objects.add_scores({
+                (self.author_id, self.question.topic_id): (score or 0) - (old_score or 0)
+            })
+            if done:
+                # the statistics of finished questions are already counted
+                UserTopicStats.objects.add_counts(self.question.topic_id, {self.author_id: delta})
+
     def __str__(self):
         return self.answer
 
@@ -57,6 +215,12 @@ class Answer(models.Model):
         verbose_name = "Antwort"
         verbose_name_plural = "Antworten"
         unique_together = ("author", "question")
+        indexes = [
+            # answers to a question, and whether a user answered it
+            models.Index(fields=["question", "author"], name="answer_question_author_idx"),
+            # score totals per author and team, covers the join to the question
+            models.Index(fields=["author", "question", "score"], name="answer_author_score_idx"),
+        ]
 
 STATE_CHOICES = (
     ("open", "offen"),
@@ -71,6 +235,21 @@ MODE_CHOICES = (
     ("train", "Training"),
     ("competition", "Wettkampf")
 )
+class TeamQuerySet(models.QuerySet):
+    def with_stats(self, user):
+        """Annotate question counts and the done flag of the user for the current phase."""
+        return self.annotate(
+            question_count=Count("questions", distinct=True),
+            question_number=Count("questions", filter=Q(questions__done=True), distinct=True) + 1,
+            is_user_done=Case(
+                When(state="question", then=Exists(Question.objects.filter(team=OuterRef("pk"), author=user))),
+                When(state="answer", current_question__author=user, then=Value(True)),
+                When(state="answer", then=Exists(Answer.objects.filter(question=OuterRef("current_question"), author=user))),
+                default=Value(None),
+                output_field=NullBooleanField(),
+            ),
+        ).select_related("creator", "topic", "current_question")
+
 class Team(models.Model):
     creator = models.ForeignKey("auth.User", related_name="teams_as_creator", on_delete=models.CASCADE, verbose_name="Gründer")
     topic = models.ForeignKey("Topic", verbose_name="Thema", on_delete=models.CASCADE)
@@ -84,33 +263,100 @@ class Team(models.Model):
 
     created_at = models.DateTimeField("Erstellt am", auto_now_add=True)
 
+    objects = TeamQuerySet.as_manager()
+
     def next_state(self):
         """Return the next state of the team"""
 
-        if self.state in ["open", "done"] and self.members.count() > 1:
-            self.questions.clear()
-            self.membership_set.update(partial=0,wrong=0,right=0)
+        if self.state in ["open", "done", "archived"] and self.members.count() > 1:
+            self.archive_round()
             self.state = "question"
 
         if self.state == "scoring":
-            for ms in self.membership_set.all():
-                scores = Answer.objects.filter(author=ms.user, question__team=self)
-                
-                ms.partial = scores.filter(score=1).count()
-                ms.right = scores.filter(score=3).count()
-                ms.wrong = scores.filter(score=0).count()
-                ms.save()
-
-            self.current_question.done = True
-            self.current_question.save()
-
-            self.current_question = self.questions.filter(answer=None).first()
-            if self.current_question:
-                self.state = "answer"
-            else:
-                self.state = "done"
-        
-        self.save()
+            # membership counters are kept up to date by Answer.set_score
+            with transaction.atomic():
+                self.current_question.done = True
+                self.current_question.save()
+                UserTopicStats.objects.add_question(self.current_question)
+
+                self.current_question = self.questions.filter(answer=None).first()
+                if self.current_question:
+                    self.state = "answer"
+                else:
+                    self.state = "done"
+
+                self.save()
+        else:
+            self.save()
+
+    def archive_round(self):
+        """
+        Move the answers of the last round into an ArchivedRound and reset the
+        membership counters. The questions stay in the question pool of their
+        topic, without the team. Returns the round, None if there was none.
+        """
+        with transaction.atomic():
+            archived = ArchivedRound.objects.archive(self)
+            self.questions.clear()
+            self.membership_set.update(partial=0,wrong=0,right=0)
+        return archived
+
+    def archive(self):
+        """Archive the round of a finished team and set it to archived, see archive_round."""
+        with transaction.atomic():
+            team = Team.objects.select_for_update().get(pk=self.pk)
+            if team.state != "done":
+                return None
+            archived = team.archive_round()
+            team.state = self.state = "archived"
+            team.save()
+        return archived
+
+    def post_question(self, user, question, model_answer):
+        """
+        Add the question of the user and start the answer phase once all
+        members have posted theirs.
+
+        The team row is locked, so of many concurrent submissions exactly the
+        last one switches the phase. Returns the updated team.
+        """
+        with transaction.atomic():
+            team = Team.objects.select_for_update().get(pk=self.pk)
+            if team.state != "question":
+                raise PermissionDenied("Das Team ist nicht in der Erarbeitungsphase.")
+
+            team.questions.create(author=user, question=question, model_answer=model_answer, topic_id=team.topic_id)
+
+            waiting = team.membership_set.exclude(user__in=team.questions.values("author")).exists()
+            if not waiting:
+                team.current_question = team.questions.order_by("pk").first()
+                team.state = "answer"
+            team.save()
+        return team
+
+    def post_answer(self, user, answer):
+        """
+        Add the answer of the user to the current question and start the
+        scoring phase once all members except its author have answered.
+
+        Locks the team row like post_question. Returns the updated team.
+        """
+        with transaction.atomic():
+            team = Team.objects.select_for_update().get(pk=self.pk)
+            if team.state != "answer" or team.current_question_id is None:
+                raise PermissionDenied("Das Team ist nicht in der Fragephase.")
+
+            Answer.objects.create(author=user, question_id=team.current_question_id, answer=answer)
+
+            waiting = team.membership_set.exclude(
+                user__in=Question.objects.filter(pk=team.current_question_id).values("author")
+            ).exclude(
+                user__in=Answer.objects.filter(question_id=team.current_question_id).values("author")
+            ).exists()
+            if not waiting:
+                team.state = "scoring"
+            team.save()
+        return team
 
     def user_done(self, user):
         """Checks if user is done for this phase"""
@@ -123,6 +369,16 @@ class Team(models.Model):
                 return self.current_question.answer_set.filter(author=user).count() > 0
             return False            
 
+    def done_user_ids(self):
+        """Ids of all users that are done for this phase, None if user_done does not apply."""
+        if self.state == "question":
+            return set(self.questions.values_list("author_id", flat=True))
+        if self.state == "answer":
+            if self.current_question_id:
+                return set(Question.objects.filter(pk=self.current_question_id).values_list("author_id", flat=True)) | \
+                    set(Answer.objects.filter(question_id=self.current_question_id).values_list("author_id", flat=True))
+            return set()
+
     def get_user_question(self, user):
         """Get the question that was submitted by the specified user."""
         return self.questions.filter(author=user).first()
@@ -155,4 +411,283 @@ class Membership(models.Model):
         verbose_name = "Mitgliedschaft"
         verbose_name_plural = "Mitgliedschaften"
 
-        unique_together = ("user", "team")
\ No newline at end of file
+        unique_together = ("user", "team")
+
+
+# sent with the changed {board: {user_id: delta}} and the removed boards,
+# e.g. to mirror the leaderboards elsewhere (see api.leaderboard)
+leaderboard_changed = Signal()
+
+GLOBAL_BOARD = "global"
+
+def topic_board(topic_id):
+    return f"topic:{topic_id}"
+
+class LeaderboardEntryQuerySet(models.QuerySet):
+    def add_scores(self, deltas):
+        """
+        Move the scores of the users by the given {(user_id, topic_id): points},
+        on the board of the topic and on the global board.
+
+        Missing entries are created, then every board is updated with one
+        UPDATE, so the number of queries does not depend on the number of users.
+        """
+        boards = defaultdict(Counter)
+        for (user_id, topic_id), points in deltas.items():
+            if points:
+                boards[GLOBAL_BOARD][user_id] += points
+                boards[topic_board(topic_id)][user_id] += points
+        boards = {
+            board: {user_id: points for user_id, points in users.items() if points}
+            for board, users in boards.items()
+            if any(users.values())
+        }
+        if not boards:
+            return
+
+        with transaction.atomic(savepoint=False):
+            self.bulk_create(
+                [LeaderboardEntry(board=board, user_id=user_id) for board, users in boards.items() for user_id in users],
+                ignore_conflicts=True,
+            )
+            for board, users in boards.items():
+                self.filter(board=board, user_id__in=users).update(score=F("score") + Case(
+                    *[When(user_id=user_id, then=Value(points)) for user_id, points in users.items()],
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                ))
+        leaderboard_changed.send(sender=LeaderboardEntry, boards=boards, removed=[])
+
+    def remove_boards(self, boards):
+        self.filter(board__in=boards).delete()
+        leaderboard_changed.send(sender=LeaderboardEntry, boards={}, removed=list(boards))
+
+class LeaderboardEntry(models.Model):
+    """
+    Score of a user on a leaderboard: the points of all scored answers of the
+    user, on the board of the topic of the question and on the global board.
+    Maintained by Answer.set_score, AnswerQuerySet.set_scores and api.signals.
+    """
+
+    board = models.CharField("Rangliste", max_length=30)
+    user = models.ForeignKey("auth.User", on_delete=models.CASCADE)
+    score = models.IntegerField("Punkte", default=0)
+
+    objects = LeaderboardEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Ranglisteneintrag"
+        verbose_name_plural = "Ranglisteneinträge"
+
+        unique_together = ("board", "user")
+        indexes = [
+            # pages of a board in rank order
+            models.Index(fields=["board", "-score", "user"], name="leaderboard_rank_idx"),
+        ]
+
+STAT_FIELDS = ("answers", "right", "partial", "wrong", "questions")
+
+class UserTopicStatsQuerySet(models.QuerySet):
+    def add_question(self, question, sign=1):
+        """
+        Count a finished question for its author and its answers for theirs,
+        or take them back with sign=-1.
+        """
+        counts = defaultdict(Counter)
+        counts[question.author_id]["questions"] += sign
+        for author_id, score in Answer.objects.filter(question=question).values_list("author_id", "score"):
+            counts[author_id]["answers"] += sign
+            if score is not None:
+                counts[author_id][SCORE_FIELDS[score]] += sign
+        self.add_counts(question.topic_id, counts)
+
+    def add_counts(self, topic_id, counts):
+        """
+        Move the counters of the topic by the given {user_id: {field: delta}}.
+        Only users with a count to add get a new row, a missing row has nothing
+        to take back (and the topic or the user may be being deleted).
+        """
+        with transaction.atomic(savepoint=False):
+            self.create_missing(topic_id, [
+                user_id for user_id, fields in counts.items() if any(delta > 0 for delta in fields.values())
+            ])
+            update = {
+                field: F(field) + Case(
+                    *[When(user_id=user_id, then=Value(fields[field])) for user_id, fields in counts.items() if fields[field]],
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )
+                for field in STAT_FIELDS
+                if any(fields[field] for fields in counts.values())
+            }
+            if update:
+                self.filter(topic_id=topic_id, user_id__in=counts).update(**update)
+
+    def create_missing(self, topic_id, user_ids):
+        """
+        Insert empty rows for the users of the topic that have none, in one
+        INSERT ... SELECT. bulk_create would split a round of first-time
+        authors into batches of SQLite's parameter limit.
+        """
+        if not user_ids:
+            return
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        meta = self.model._meta
+        user_meta = meta.get_field("user").related_model._meta
+        columns = [meta.get_field("user").column, meta.get_field("topic").column] + [
+            meta.get_field(field).column for field in STAT_FIELDS
+        ]
+        sql = (
+            "{insert} {table} ({columns}) SELECT u.{pk}, %s{zeros} FROM {users} u "
+            "WHERE u.{pk} IN ({ids}) AND NOT EXISTS "
+            "(SELECT 1 FROM {table} s WHERE s.{user} = u.{pk} AND s.{topic} = %s) {suffix}"
+        ).format(
+            insert=connection.ops.insert_statement(ignore_conflicts=True),
+            table=qn(meta.db_table),
+            columns=", ".join(qn(column) for column in columns),
+            pk=qn(user_meta.pk.column),
+            zeros=", 0" * len(STAT_FIELDS),
+            users=qn(user_meta.db_table),
+            ids=", ".join(["%s"] * len(user_ids)),
+            user=qn(columns[0]),
+            topic=qn(columns[1]),
+            suffix=connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [topic_id, *user_ids, topic_id])
+
+class UserTopicStats(models.Model):
+    """
+    Answers and questions of a user in a topic, counted when a question is
+    finished (see Team.next_state), so only finished questions count.
+    Rebuilt by the backfill_user_stats command.
+    """
+
+    user = models.ForeignKey("auth.User", on_delete=models.CASCADE, related_name="topic_stats")
+    topic = models.ForeignKey("Topic", verbose_name="Thema", on_delete=models.CASCADE)
+
+    # not positive, deleting a question that finished before the backfill
+    # takes back counts that were never added
+    answers = models.IntegerField("Antworten", default=0)
+    right = models.IntegerField("richtig", default=0)
+    partial = models.IntegerField("tlw. richtig", default=0)
+    wrong = models.IntegerField("falsch", default=0)
+    questions = models.IntegerField("Fragen", default=0)
+
+    objects = UserTopicStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Statistik"
+        verbose_name_plural = "Statistiken"
+
+        unique_together = ("user", "topic")
+
+class ArchivedRoundQuerySet(models.QuerySet):
+    def archive(self, team):
+        """
+        Write the questions of the team with their answers and the membership
+        counters into a new round, add the answer counts of its users and
+        delete the answers. Returns the round, None if the team has no questions.
+        """
+        questions = list(team.questions.order_by("pk"))
+        if not questions:
+            return None
+        answers = defaultdict(list)
+        for answer in Answer.objects.filter(question__in=questions).order_by("pk"):
+            answers[answer.question_id].append(answer)
+
+        records = [
+            {"membership": {"user": ms.user_id, "right": ms.right, "partial": ms.partial, "wrong": ms.wrong}}
+            for ms in team.membership_set.order_by("pk")
+        ]
+        counts = defaultdict(Counter)
+        for question in questions:
+            records.append({
+                "question": {
+                    "id": question.pk,
+                    "author": question.author_id,
+                    "topic": question.topic_id,
+                    "question": question.question,
+                    "model_answer": question.model_answer,
+                    "created_at": question.created_at,
+                },
+                "answers": [
+                    {"author": answer.author_id, "answer": answer.answer, "score": answer.score, "created_at": answer.created_at}
+                    for answer in answers[question.pk]
+                ],
+            })
+            for answer in answers[question.pk]:
+                counts[answer.author_id, question.topic_id]["answers"] += 1
+                if answer.score is not None:
+                    counts[answer.author_id, question.topic_id][SCORE_FIELDS[answer.score]] += 1
+
+        with transaction.atomic(savepoint=False):
+            archived = self.create(
+                team=team,
+                topic_id=team.topic_id,
+                name=team.name,
+                questions=len(questions),
+                answers=sum(len(rows) for rows in answers.values()),
+                data=ArchivedRound.pack(records),
+            )
+            ArchivedScore.objects.bulk_create([
+                ArchivedScore(round=archived, user_id=user_id, topic_id=topic_id, **fields)
+                for (user_id, topic_id), fields in counts.items()
+            ])
+            Answer.objects.filter(question__in=questions).delete()
+        return archived
+
+class ArchivedRound(models.Model):
+    """
+    A finished round of a team, moved out of the live tables by
+    Team.archive_round. data holds one zlib compressed JSON line per
+    membership ({"membership": ...}) and per question with its answers
+    ({"question": ..., "answers": [...]}), see records().
+    """
+
+    team = models.ForeignKey("Team", null=True, blank=True, on_delete=models.SET_NULL, related_name="archived_rounds")
+    topic = models.ForeignKey("Topic", verbose_name="Thema", on_delete=models.CASCADE)
+    name = models.CharField("Name", max_length=100)
+    questions = models.PositiveIntegerField("Fragen", default=0)
+    answers = models.PositiveIntegerField("Antworten", default=0)
+    data = models.BinaryField("Daten")
+
+    archived_at = models.DateTimeField("Archiviert am", auto_now_add=True)
+
+    objects = ArchivedRoundQuerySet.as_manager()
+
+    @staticmethod
+    def pack(records):
+        lines = "\n".join(json.dumps(record, cls=DjangoJSONEncoder) for record in records)
+        return zlib.compress(lines.encode())
+
+    def records(self):
+        """Return the memberships and questions of the round as stored."""
+        return [json.loads(line) for line in zlib.decompress(self.data).decode().split("\n")]
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Archivierte Runde"
+        verbose_name_plural = "Archivierte Runden"
+
+class ArchivedScore(models.Model):
+    """
+    Answer counts of a user per topic in an archived round, so the leaderboard
+    and statistics rebuilds still count the archived answers.
+    """
+
+    round = models.ForeignKey("ArchivedRound", on_delete=models.CASCADE, related_name="scores")
+    user = models.ForeignKey("auth.User", on_delete=models.CASCADE)
+    topic = models.ForeignKey("Topic", verbose_name="Thema", on_delete=models.CASCADE)
+
+    answers = models.PositiveIntegerField("Antworten", default=0)
+    right = models.PositiveIntegerField("richtig", default=0)
+    partial = models.PositiveIntegerField("tlw. richtig", default=0)
+    wrong = models.PositiveIntegerField("falsch", default=0)
+
+    class Meta:
+        verbose_name = "Archivierte Bewertung"
+        verbose_name_plural = "Archivierte Bewertungen"
@@ -1,23 +1,69 @@
 from graphene import relay, ObjectType
-from graphene_django import DjangoObjectType
+from graphene_django import DjangoConnectionField, DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
-from api.models import Topic, Team, Question, Answer, Membership
+from api.models import Topic, Team, Question, Answer, Membership, UserTopicStats, GLOBAL_BOARD, topic_board
 from django.contrib.auth.models import User
 import graphene
-from rx import Observable
+from graphql.error import GraphQLError
 from graphql_relay import from_global_id
+from graphql_relay.connection.arrayconnection import connection_from_list_slice, cursor_to_offset
 from graphql_jwt.decorators import login_required
 from graphene_subscriptions.events import UPDATED 
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
 import django_filters
-from django.db.models import Q, Count, Case, When, IntegerField
+from django.db import transaction
+from django.db.models import Q, Exists, OuterRef
+from promise import Promise
+from api.cache import membership_cache
+from api.events import team_group_name
+from api.subscriptions import viewer_fields
+from api.search import get_search_backend
+from api.leaderboard import get_leaderboard_backend
+from api.loaders import get_loaders, reset_loaders, load_related
+
+
+class PagedConnectionField(DjangoConnectionField):
+    """Connection field that returns at most GRAPHQL_MAX_PAGE_SIZE items per page."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_limit", settings.GRAPHQL_MAX_PAGE_SIZE)
+        super(PagedConnectionField, self).__init__(*args, **kwargs)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable):
+        if args.get("first") is None and args.get("last") is None:
+            args = dict(args, first=settings.GRAPHQL_MAX_PAGE_SIZE)
+        return super(PagedConnectionField, cls).resolve_connection(connection, args, iterable)
+
+class FilterConnectionField(PagedConnectionField, DjangoFilterConnectionField):
+    """Filter connection field that returns at most GRAPHQL_MAX_PAGE_SIZE items per page."""
+
+class LoaderFilterConnectionField(FilterConnectionField):
+    """Filter connection field that passes batched (promise) results through unfiltered."""
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        if Promise.is_thenable(iterable):
+            return iterable
+        return super(LoaderFilterConnectionField, cls).resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
 
 class UserNode(DjangoObjectType):
     is_me = graphene.Boolean()
+    topic_stats = graphene.List(graphene.NonNull(lambda: UserTopicStatsNode))
 
     def resolve_is_me(parent, info):
+        fields = viewer_fields(info)
+        if fields is not None:
+            fields.append((info.path, "is_me", parent))
+            return None
         return info.context.user == parent
 
+    def resolve_topic_stats(parent, info):
+        return get_loaders(info).user_topic_stats.load(parent.pk)
+
     class Meta:
         model = User
         fields = ["username", "last_name", "first_name", "id","email"]
@@ -27,6 +73,9 @@ class UserNode(DjangoObjectType):
         interfaces = (relay.Node,)
 
 class AnswerNode(DjangoObjectType):
+    def resolve_author(parent, info):
+        return get_loaders(info).users.load(parent.author_id)
+
     class Meta:
         model = Answer
         fields = ("author", "answer", "score")
@@ -37,7 +86,7 @@ class QuestionFilter(django_filters.FilterSet):
     own = django_filters.BooleanFilter(method="own_filter")
 
     def query_filter(self, queryset, name, value):
-        return queryset.filter(Q(question__icontains=value) | Q(model_answer__icontains=value)).distinct()
+        return get_search_backend().search(queryset, value)
 
     def own_filter(self, queryset, name, value):
         if value:
@@ -51,6 +100,17 @@ class QuestionFilter(django_filters.FilterSet):
 
 
 class QuestionNode(DjangoObjectType):
+    answer_set = PagedConnectionField(AnswerNode)
+
+    def resolve_author(parent, info):
+        return get_loaders(info).users.load(parent.author_id)
+
+    def resolve_topic(parent, info):
+        return get_loaders(info).topics.load(parent.topic_id)
+
+    def resolve_answer_set(parent, info, **kwargs):
+        return get_loaders(info).question_answers.load(parent.pk)
+
     class Meta:
         model = Question
         fields = ("question", "model_answer", "author", "answer_set", "topic")
@@ -66,6 +126,9 @@ class MembershipNode(DjangoObjectType):
     def resolve_score(parent, info):
         return parent.get_score()
 
+    def resolve_user(parent, info):
+        return get_loaders(info).users.load(parent.user_id)
+
     class Meta:
         model = Membership
         fields = ["user", "right", "wrong", "partial", "joined"]
@@ -76,21 +139,52 @@ class TeamNode(DjangoObjectType):
     user_done = graphene.Boolean()
     question_count = graphene.Int()
     question_number = graphene.Int()
+    members = LoaderFilterConnectionField(UserNode)
+    membership_set = PagedConnectionField(MembershipNode)
 
     def resolve_question_number(parent, info):
         if hasattr(parent, "question_number"):
             return parent.question_number
         else:
-            return parent.questions.filter(done=True).count() + 1
+            return get_loaders(info).team_question_stats.load(parent.pk).then(
+                lambda stats: stats["done_count"] + 1
+            )
 
     def resolve_question_count(parent, info):
         if hasattr(parent, "question_count"):
             return parent.question_count
         else:
-            return parent.questions.count()
+            return get_loaders(info).team_question_stats.load(parent.pk).then(
+                lambda stats: stats["question_count"]
+            )
 
     def resolve_user_done(parent, info):
-        return parent.user_done(info.context.user)
+        fields = viewer_fields(info)
+        if fields is not None:
+            fields.append((info.path, "user_done", parent))
+            return None
+        if hasattr(parent, "is_user_done"):
+            return parent.is_user_done
+        else:
+            return get_loaders(info).user_done.load(parent)
+
+    def resolve_creator(parent, info):
+        return load_related(parent, "creator", get_loaders(info).users)
+
+    def resolve_topic(parent, info):
+        return load_related(parent, "topic", get_loaders(info).topics)
+
+    def resolve_current_question(parent, info):
+        return load_related(parent, "current_question", get_loaders(info).questions)
+
+    def resolve_members(parent, info, **kwargs):
+        if kwargs.get("username__icontains"):
+            # filtered lists are not batched, let the filterset handle them
+            return parent.members.all()
+        return get_loaders(info).team_members.load(parent.pk)
+
+    def resolve_membership_set(parent, info, **kwargs):
+        return get_loaders(info).team_memberships.load(parent.pk)
 
     class Meta:
         model = Team
@@ -100,8 +194,14 @@ class TeamNode(DjangoObjectType):
 
     @classmethod
     def get_node(cls, info, id):
-        team = Team.objects.get(pk=id)
-        if info.context.user not in team.members.all():
+        user = info.context.user
+        if not user.is_authenticated:
+            raise PermissionDenied("Benutzer nicht in diesem Team.")
+
+        team = Team.objects.with_stats(user).annotate(
+            is_member=Exists(Membership.objects.filter(team=OuterRef("pk"), user=user))
+        ).get(pk=id)
+        if not team.is_member:
             raise PermissionDenied("Benutzer nicht in diesem Team.")
         return team
 
@@ -124,19 +224,12 @@ class TopicFilter(django_filters.FilterSet):
         )
     )
 
-    @property
-    def qs(self):
-        # The query context can be found in self.request.
-        return super(TopicFilter, self).qs.annotate(
-            question_count=Count("question"),
-        )
-
 
 class TopicNode(DjangoObjectType):
     question_count = graphene.Int()
 
     def resolve_question_count(parent, info):
-        return getattr(parent, "question_count", None)
+        return parent.question_count
 
     class Meta: 
         model = Topic
@@ -144,19 +237,53 @@ class TopicNode(DjangoObjectType):
         fields = ["name", "code"]
 
 
+class UserTopicStatsNode(DjangoObjectType):
+    def resolve_topic(parent, info):
+        return get_loaders(info).topics.load(parent.topic_id)
+
+    class Meta:
+        model = UserTopicStats
+        fields = ("topic", "answers", "right", "partial", "wrong", "questions")
+
+
+
+class LeaderboardEntryNode(ObjectType):
+    rank = graphene.Int()
+    score = graphene.Int()
+    user = graphene.Field(UserNode)
+
+    def resolve_user(parent, info):
+        return get_loaders(info).users.load(parent.user_id)
+
+
+class LeaderboardConnection(relay.Connection):
+    class Meta:
+        node = LeaderboardEntryNode
+
+
+def leaderboard_board(topic):
+    """Board of the topic with the given global id, the global board for None."""
+    return topic_board(from_global_id(topic)[1]) if topic else GLOBAL_BOARD
+
+
 class Subscription(graphene.ObjectType):
     team_updated = graphene.Field(TeamNode, id=graphene.ID())
 
 
     @login_required
     def resolve_team_updated(root, info, id):
-        team = Team.objects.get(pk=from_global_id(id)[1])
-        if info.context.user not in team.members.all():
+        team_id = int(from_global_id(id)[1])
+        if not membership_cache.is_member(team_id, info.context.user.pk):
             raise PermissionDenied("Benutzer nicht im Team.")
 
+        if info.context.join_group:
+            # only receive the events of this team
+            info.context.join_group(team_group_name(team_id))
+
         def map_event(event):
             team = event.instance
-            if info.context.user not in team.members.all():
+            reset_loaders(info)
+            if not membership_cache.is_member(team.pk, info.context.user.pk):
                 raise PermissionDenied("Benutzer nicht im Team.")
             return team
 
@@ -164,7 +291,7 @@ class Subscription(graphene.ObjectType):
             lambda event:
                 event.operation == UPDATED and
                 isinstance(event.instance, Team) and
-                event.instance.pk == int(from_global_id(id)[1])
+                event.instance.pk == team_id
         ).map(map_event)
 
 class NextPhaseMutation(relay.ClientIDMutation):
@@ -200,21 +327,7 @@ class PostQuestionMutation(relay.ClientIDMutation):
     @classmethod
     @login_required
     def mutate_and_get_payload(cls, root, info, id, question, model_answer):
-        team = Team.objects.get(pk=from_global_id(id)[1])
-
-        team.questions.create(
-            author=info.context.user,
-            question=question,
-            model_answer=model_answer,
-            topic=team.topic,
-        )
-
-        if team.questions.count() == team.members.count():
-            team.current_question = team.questions.first()
-            team.state = "answer"
-
-        team.save()
-
+        team = Team(pk=from_global_id(id)[1]).post_question(info.context.user, question, model_answer)
         return PostQuestionMutation(team=team)
 
        
@@ -229,18 +342,7 @@ class PostAnswerMutation(relay.ClientIDMutation):
     @classmethod
     @login_required
     def mutate_and_get_payload(cls, root, info, id, answer):
-        team = Team.objects.get(pk=from_global_id(id)[1])
-
-        team.current_question.answer_set.create(
-            author=info.context.user,
-            answer=answer
-        )
-
-        if team.current_question.answer_set.count() == team.members.count() - 1:
-            team.state = "scoring"
-
-        team.save()
-
+        team = Team(pk=from_global_id(id)[1]).post_answer(info.context.user, answer)
         return PostAnswerMutation(team=team)
 
 class UpdateQuestionMutation(relay.ClientIDMutation):
@@ -283,16 +385,40 @@ class ScoreAnswerMutation(relay.ClientIDMutation):
     @classmethod
     @login_required
     def mutate_and_get_payload(cls, root, info, id, score):
-        answer = Answer.objects.get(pk=from_global_id(id)[1])
-        if answer.question.author != info.context.user:
+        answer = Answer.objects.select_related("question__team").get(pk=from_global_id(id)[1])
+        if answer.question.author_id != info.context.user.pk:
             raise PermissionDenied("Du musst Fragesteller sein, um diese Antwort zu bewerten.")
 
-        answer.score = score
-        answer.save()
+        answer.set_score(score)
         answer.question.team.save()
 
         return ScoreAnswerMutation(answer=answer)
 
+class AnswerScoreInput(graphene.InputObjectType):
+    id = graphene.ID(required=True)
+    score = ScoreEnum()
+
+class ScoreAnswersMutation(relay.ClientIDMutation):
+    """Give scores to several answers of the current question at once"""
+    class Input:
+        scores = graphene.List(graphene.NonNull(AnswerScoreInput), required=True)
+
+    answers = graphene.List(AnswerNode)
+    team = graphene.Field(TeamNode)
+
+    @classmethod
+    @login_required
+    def mutate_and_get_payload(cls, root, info, scores):
+        scores = {int(from_global_id(item.id)[1]): item.get("score") for item in scores}
+        with transaction.atomic():
+            answers = Answer.objects.set_scores(scores, info.context.user)
+            team = answers[0].question.team if answers else None
+            if team:
+                # one team update for all scores
+                team.save()
+
+        return ScoreAnswersMutation(answers=answers, team=team)
+
 class CreateTeamMutation(relay.ClientIDMutation):
     """Create a team"""
     class Input:
@@ -324,7 +450,7 @@ class AddMemberMutation(relay.ClientIDMutation):
 
         if team.creator != info.context.user:
             raise PermissionDenied("Nur der Teamersteller kann Mitglieder hinzufügen.")
-        if team.state not in ["done", "open"]:
+        if team.state not in ["done", "open", "archived"]:
             raise PermissionDenied("In dieser Phase können keine Mitglieder hinzugefügt werden.")
             
         user = User.objects.get(username=username)
@@ -352,7 +478,7 @@ class RemoveMemberMutation(relay.ClientIDMutation):
 
         if team.creator != info.context.user and user != info.context.user:
             raise PermissionDenied("Nur der Teamersteller kann Mitglieder entfernen.")
-        if team.state not in ["done", "open"]:
+        if team.state not in ["done", "open", "archived"]:
             raise PermissionDenied("In dieser Phase können keine Mitglieder entfernt werden.")
 
         if user == team.creator and team.members.count() > 1:
@@ -405,7 +531,7 @@ class SetModeMutation(relay.ClientIDMutation):
 
         if team.creator != info.context.user:
             raise PermissionDenied("Nur der Teamersteller kann den Modus ändern.")
-        if team.state not in ["done", "open"]:
+        if team.state not in ["done", "open", "archived"]:
             raise PermissionDenied("In dieser Phase kann der Modus nicht geändert werden.")
             
         team.mode = mode
@@ -418,6 +544,7 @@ class Mutation(ObjectType):
     post_answer = PostAnswerMutation.Field()
     update_question = UpdateQuestionMutation.Field()
     score_answer = ScoreAnswerMutation.Field()
+    score_answers = ScoreAnswersMutation.Field()
     create_team = CreateTeamMutation.Field()
     add_member = AddMemberMutation.Field()
     remove_member = RemoveMemberMutation.Field()
@@ -430,19 +557,50 @@ class Query(ObjectType):
     topic = relay.Node.Field(TopicNode)
     question = relay.Node.Field(QuestionNode)
 
-    topics = DjangoFilterConnectionField(TopicNode, filterset_class=TopicFilter)
-    questions = DjangoFilterConnectionField(QuestionNode, filterset_class=QuestionFilter)
-    teams = DjangoFilterConnectionField(TeamNode)
-    users = DjangoFilterConnectionField(UserNode)
+    topics = FilterConnectionField(TopicNode, filterset_class=TopicFilter)
+    questions = FilterConnectionField(QuestionNode, filterset_class=QuestionFilter)
+    teams = FilterConnectionField(TeamNode)
+    users = FilterConnectionField(UserNode)
 
     me = graphene.Field(UserNode)
 
+    leaderboard = relay.ConnectionField(LeaderboardConnection, topic=graphene.ID())
+    my_rank = graphene.Field(LeaderboardEntryNode, topic=graphene.ID())
+
     @login_required
     def resolve_teams(self, info):
-        return Team.objects.filter(members=info.context.user)
+        return Team.objects.filter(members=info.context.user).with_stats(info.context.user)
 
     def resolve_me(self, info):
         user = info.context.user
         if user.is_authenticated:
             return user
         return None
+
+    def resolve_leaderboard(self, info, topic=None, first=None, after=None, last=None, before=None):
+        """Page of the ranking of the topic, or of all topics, read from the position of after."""
+        if last is not None or before is not None:
+            raise GraphQLError("The leaderboard is only paginated forwards, with first and after.")
+        if first is None:
+            first = settings.GRAPHQL_MAX_PAGE_SIZE
+        limit = max(0, min(first, settings.GRAPHQL_MAX_PAGE_SIZE))
+        after_offset = cursor_to_offset(after) if after else None
+        offset = after_offset + 1 if after_offset is not None else 0
+
+        # one more to know whether there is a next page
+        rankings = get_leaderboard_backend().page(leaderboard_board(topic), offset, limit + 1)
+        return connection_from_list_slice(
+            rankings,
+            {"first": limit, "after": after},
+            connection_type=LeaderboardConnection,
+            edge_type=LeaderboardConnection.Edge,
+            pageinfo_type=relay.PageInfo,
+            slice_start=offset,
+            list_length=offset + len(rankings),
+        )
+
+    def resolve_my_rank(self, info, topic=None):
+        user = info.context.user
+        if not user.is_authenticated:
+            return None
+        return get_leaderboard_backend().rank(leaderboard_board(topic), user.pk)
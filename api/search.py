@@ -0,0 +1,118 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from api.models import Question
+
+
+def search_terms(value):
+    """Split a search string into words, ignoring all query syntax."""
+    return re.findall(r"\w+", value)
+
+
+class SearchBackend:
+    """
+    Full-text search over question and model answer.
+
+    This fallback filters with icontains; the database specific backends
+    use a full-text index, rank the results and match word prefixes.
+    """
+
+    def search(self, queryset, value):
+        terms = search_terms(value)
+        for term in terms:
+            queryset = queryset.filter(Q(question__icontains=term) | Q(model_answer__icontains=term))
+        return queryset
+
+    def index(self, question):
+        """Add or update the index entry of a question."""
+
+    def remove(self, question_id):
+        """Remove the index entry of a question."""
+
+    def rebuild(self, batch_size=1000):
+        """Rebuild the whole index, returns the number of indexed questions."""
+        return 0
+
+
+class SqliteSearchBackend(SearchBackend):
+    """SQLite FTS5 table api_question_search, kept in sync by api.signals."""
+
+    table = "api_question_search"
+
+    def match_expression(self, value):
+        return " ".join('"{}"*'.format(term) for term in search_terms(value))
+
+    def search(self, queryset, value):
+        expression = self.match_expression(value)
+        if not expression:
+            return queryset
+        # joined once, so the index is queried once and its bm25 rank read per row
+        return queryset.extra(
+            tables=[self.table],
+            where=[f"{self.table} MATCH %s", f"{self.table}.rowid = api_question.id"],
+            params=[expression],
+            select={"search_rank": f"{self.table}.rank"},
+        ).order_by("search_rank", "pk")
+
+    def index(self, question):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {self.table} (rowid, question, model_answer) VALUES (%s, %s, %s)",
+                [question.pk, question.question, question.model_answer],
+            )
+
+    def remove(self, question_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [question_id])
+
+    def rebuild(self, batch_size=1000):
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            last_pk = 0
+            while True:
+                rows = list(
+                    Question.objects.filter(pk__gt=last_pk).order_by("pk")
+                    .values_list("pk", "question", "model_answer")[:batch_size]
+                )
+                if not rows:
+                    break
+                cursor.executemany(
+                    f"INSERT INTO {self.table} (rowid, question, model_answer) VALUES (%s, %s, %s)", rows
+                )
+                count += len(rows)
+                last_pk = rows[-1][0]
+        return count
+
+
+class MysqlSearchBackend(SearchBackend):
+    """MySQL FULLTEXT index on question and model answer, maintained by InnoDB."""
+
+    def match_expression(self, value):
+        return " ".join("+{}*".format(term) for term in search_terms(value))
+
+    def search(self, queryset, value):
+        expression = self.match_expression(value)
+        if not expression:
+            return queryset
+        match = "MATCH (api_question.question, api_question.model_answer) AGAINST (%s IN BOOLEAN MODE)"
+        return queryset.annotate(search_rank=RawSQL(match, [expression])).filter(
+            search_rank__gt=0
+        ).order_by("-search_rank", "pk")
+
+    def rebuild(self, batch_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute("OPTIMIZE TABLE api_question")
+        return Question.objects.count()
+
+
+def get_search_backend():
+    """Return the search backend for the database in use."""
+    if connection.vendor == "sqlite":
+        return SqliteSearchBackend()
+    if connection.vendor == "mysql":
+        return MysqlSearchBackend()
+    return SearchBackend()
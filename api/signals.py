@@ -1,13 +1,128 @@
-from django.db.models.signals import post_save, post_delete, m2m_changed
-from graphene_subscriptions.signals import post_save_subscription, post_delete_subscription
+import copy
+from collections import Counter
 
-from .models import Team
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
+from graphene_subscriptions.events import CREATED, UPDATED, DELETED
 
-post_save.connect(post_save_subscription, sender=Team, dispatch_uid="team_post_save")
-post_delete.connect(post_delete_subscription, sender=Team, dispatch_uid="team_post_delete")
+from .models import (
+    Topic, Team, Membership, Question, Answer, LeaderboardEntry, UserTopicStats, leaderboard_changed, topic_board,
+)
+from .events import team_events
+from .cache import membership_cache, token_cache
+from .search import get_search_backend
+from .leaderboard import get_leaderboard_backend
+
+
+def team_post_save(sender, instance, created, **kwargs):
+    # snapshot the team, it may change again before the event is sent
+    instance = copy.copy(instance)
+    transaction.on_commit(lambda: team_events.add(CREATED if created else UPDATED, instance))
+
+def team_post_delete(sender, instance, **kwargs):
+    instance = copy.copy(instance)
+    transaction.on_commit(lambda: team_events.add(DELETED, instance))
+
+post_save.connect(team_post_save, sender=Team, dispatch_uid="team_post_save")
+post_delete.connect(team_post_delete, sender=Team, dispatch_uid="team_post_delete")
+
+def membership_changed(sender, instance, **kwargs):
+    membership_cache.invalidate(instance.team_id)
+
+def members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        membership_cache.invalidate(instance.pk)
+    elif pk_set:
+        for team_id in pk_set:
+            membership_cache.invalidate(team_id)
+    else:
+        membership_cache.invalidate()
+
+post_save.connect(membership_changed, sender=Membership, dispatch_uid="membership_post_save")
+post_delete.connect(membership_changed, sender=Membership, dispatch_uid="membership_post_delete")
+m2m_changed.connect(members_changed, sender=Team.members.through, dispatch_uid="team_members_changed")
+
+def user_post_init(sender, instance, **kwargs):
+    # remember the credentials, other changes (like last_login) keep the tokens
+    instance._loaded_credentials = (instance.__dict__.get("password"), instance.__dict__.get("is_active"))
+
+def user_post_save(sender, instance, created, **kwargs):
+    # password changes and deactivation revoke cached tokens
+    credentials = (instance.password, instance.is_active)
+    if not created and getattr(instance, "_loaded_credentials", None) != credentials:
+        token_cache.invalidate_user(instance.pk)
+    instance._loaded_credentials = credentials
+
+def user_removed(sender, instance=None, user=None, **kwargs):
+    # deletion and logout revoke cached tokens
+    user = instance or user
+    if user is not None:
+        token_cache.invalidate_user(user.pk)
+
+post_init.connect(user_post_init, sender=User, dispatch_uid="user_token_post_init")
+post_save.connect(user_post_save, sender=User, dispatch_uid="user_token_post_save")
+post_delete.connect(user_removed, sender=User, dispatch_uid="user_token_post_delete")
+user_logged_out.connect(user_removed, dispatch_uid="user_token_logged_out")
+
+def question_post_save(sender, instance, created, **kwargs):
+    text = (instance.question, instance.model_answer)
+    if created or getattr(instance, "_loaded_text", None) != text:
+        get_search_backend().index(instance)
+    instance._loaded_text = text
+
+def question_post_delete(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+post_save.connect(question_post_save, sender=Question, dispatch_uid="question_search_post_save")
+post_delete.connect(question_post_delete, sender=Question, dispatch_uid="question_search_post_delete")
+
+def question_topic_saved(sender, instance, created, **kwargs):
+    deltas = Counter()
+    if created:
+        deltas[instance.topic_id] += 1
+    elif getattr(instance, "_loaded_topic_id", instance.topic_id) != instance.topic_id:
+        deltas[instance._loaded_topic_id] -= 1
+        deltas[instance.topic_id] += 1
+    Topic.objects.add_question_counts(deltas)
+    instance._loaded_topic_id = instance.topic_id
+
+def question_topic_deleted(sender, instance, **kwargs):
+    Topic.objects.add_question_counts({instance.topic_id: -1})
+
+post_save.connect(question_topic_saved, sender=Question, dispatch_uid="question_topic_post_save")
+post_delete.connect(question_topic_deleted, sender=Question, dispatch_uid="question_topic_post_delete")
+
+def question_scores_deleted(sender, instance, **kwargs):
+    # the answers are deleted with the question, and their points with them
+    points = Answer.objects.filter(question=instance, score__gt=0).values("author_id").annotate(points=Sum("score"))
+    LeaderboardEntry.objects.add_scores({(row["author_id"], instance.topic_id): -row["points"] for row in points})
+
+def question_stats_deleted(sender, instance, **kwargs):
+    if instance.done:
+        UserTopicStats.objects.add_question(instance, sign=-1)
+
+def topic_board_deleted(sender, instance, **kwargs):
+    LeaderboardEntry.objects.remove_boards([topic_board(instance.pk)])
+
+def leaderboard_mirror(sender, boards, removed, **kwargs):
+    get_leaderboard_backend().changed(boards, removed)
+
+def leaderboard_user_deleted(sender, instance, **kwargs):
+    get_leaderboard_backend().user_removed(instance.pk)
+
+pre_delete.connect(question_scores_deleted, sender=Question, dispatch_uid="question_leaderboard_pre_delete")
+pre_delete.connect(question_stats_deleted, sender=Question, dispatch_uid="question_stats_pre_delete")
+post_delete.connect(topic_board_deleted, sender=Topic, dispatch_uid="topic_leaderboard_post_delete")
+leaderboard_changed.connect(leaderboard_mirror, dispatch_uid="leaderboard_mirror")
+post_delete.connect(leaderboard_user_deleted, sender=User, dispatch_uid="user_leaderboard_post_delete")
 
 def m2m_question(sender, instance, **kwargs):
     print("M2M changed  ")
-    post_save_subscription(Team, instance, False, **kwargs)
+    team_post_save(Team, instance, False, **kwargs)
 
-#m2m_changed.connect(m2m_question, sender=Team.questions.through, dispatch_uid="team_question_post")
\ No newline at end of file
+#m2m_changed.connect(m2m_question, sender=Team.questions.through, dispatch_uid="team_question_post")
@@ -0,0 +1,136 @@
+import copy
+import json
+import threading
+from collections import OrderedDict
+
+from graphene_django.settings import graphene_settings
+from graphene_subscriptions.consumers import AttrDict
+from graphql.execution import ExecutionResult
+from promise import Promise
+from rx.subjects import Subject
+
+
+def resolve_data(result):
+    """
+    Wait for batched fields of a subscription result.
+
+    Subscription results are not awaited by graphql-core, so fields resolved
+    through data loaders would otherwise still be pending promises.
+    """
+    if result.data:
+        result.data = {
+            key: value.get() if Promise.is_thenable(value) else value
+            for key, value in result.data.items()
+        }
+    return result
+
+
+def viewer_fields(info):
+    """
+    Return the list that per-viewer fields are recorded in, if the current
+    execution is shared between subscribers, otherwise None.
+    """
+    return getattr(info.context, "viewer_fields", None)
+
+
+def viewer_role(team, user, member_ids):
+    """Role of the user in the team; subscribers with the same role share results."""
+    if user.pk not in member_ids:
+        return "none"
+    if team.creator_id == user.pk:
+        return "creator"
+    return "member"
+
+
+class SharedResults:
+    """
+    Results of subscription documents, computed once per event and shared
+    by all subscribers of the process with the same document and role.
+
+    Fields that depend on the viewer (``isMe``, ``userDone``) are not resolved
+    in the shared execution; their paths are recorded and patched in for each
+    subscriber, which needs no queries.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, event, payload, user, role):
+        key = (
+            event.event_id,
+            payload["query"],
+            payload.get("operationName"),
+            json.dumps(payload.get("variables"), sort_keys=True),
+            role,
+        )
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.results.move_to_end(key)
+
+        if entry is None:
+            entry = self.execute(event, payload, user)
+            with self.lock:
+                self.misses += 1
+                self.results[key] = entry
+                if len(self.results) > self.size:
+                    self.results.popitem(last=False)
+
+        return self.patch(entry, user)
+
+    def execute(self, event, payload, user):
+        """Execute the subscription document for a single event."""
+        context = AttrDict({"user": user, "viewer_fields": []})
+        stream = Subject()
+
+        result = graphene_settings.SCHEMA.execute(
+            payload["query"],
+            operation_name=payload.get("operationName"),
+            variables=payload.get("variables"),
+            context=context,
+            root=stream,
+            allow_subscriptions=True,
+        )
+        if not hasattr(result, "subscribe"):
+            return result, [], None
+
+        results = []
+        subscription = result.map(resolve_data).subscribe(results.append)
+        stream.on_next(event)
+        subscription.dispose()
+        if not results:
+            # the event is not for this subscription
+            return None, [], None
+
+        fields = context.data["viewer_fields"]
+        done_user_ids = next((team.done_user_ids() for path, kind, team in fields if kind == "user_done"), None)
+        return results[0], fields, done_user_ids
+
+    def patch(self, entry, user):
+        """Return the shared result with the per-viewer fields of the user filled in."""
+        result, fields, done_user_ids = entry
+        if result is None or not fields:
+            return result
+
+        data = copy.deepcopy(result.data)
+        for path, kind, instance in fields:
+            if kind == "is_me":
+                value = instance.pk == user.pk
+            else:
+                value = None if done_user_ids is None else user.pk in done_user_ids
+
+            target = data
+            for key in path[:-1]:
+                target = target[key] if target is not None else None
+            if target is not None:
+                target[path[-1]] = value
+
+        return ExecutionResult(data=data, errors=result.errors)
+
+
+shared_results = SharedResults()
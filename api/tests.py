@@ -1,3 +1,1796 @@
-from django.test import TestCase
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.core.exceptions import PermissionDenied
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser, User, update_last_login
+from django.contrib.auth.signals import user_logged_out
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.shortcuts import get_token
+from graphene.utils.str_converters import to_camel_case, to_snake_case
+from graphql import parse
+from graphql_relay import to_global_id
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from graphene_subscriptions.events import UPDATED
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+
+from api import schema as api_schema
+from api.models import (
+    Topic, Team, Question, Answer, Membership, LeaderboardEntry, UserTopicStats, ArchivedRound, GLOBAL_BOARD,
+    TeamQuerySet, STAT_FIELDS, topic_board,
+)
+from api.backend import document_backend, document_hash
+from api.cache import membership_cache, token_cache, InvalidationStamps, MembershipCache, TokenCache
+from api.consumers import TeamSubscriptionConsumer, graphql_executor
+from api.events import TeamSubscriptionEvent, team_group_name
+from api.executors import DatabaseExecutor, check_connections, db_executor, db_sync_to_async
+from api.leaderboard import get_leaderboard_backend
+from api.limits import QueryAnalysis
+from api.metrics import metrics
+from api.subscriptions import shared_results
+from qteams.layers import FakeRedisChannelLayer
+from qteams.auth import get_user_by_token
+from qteams.routing import application
+from qteams.schema import schema
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+TEAMS_QUERY = """
+query {
+    teams {
+        edges {
+            node {
+                id
+                name
+                state
+                userDone
+                questionCount
+                questionNumber
+                creator { username }
+                topic { code }
+                currentQuestion {
+                    question
+                    author { username }
+                    answerSet { edges { node { answer author { username } } } }
+                }
+                members { edges { node { username isMe } } }
+                membershipSet { edges { node { score user { username } } } }
+            }
+        }
+    }
+}
+"""
+
+
+class SchemaTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.topic = Topic.objects.create(name="Mathematik", code="MAT")
+        self.user = User.objects.create(username="user")
+
+    def execute(self, query, user=None, variables=None):
+        request = self.factory.post("/")
+        request.user = user or self.user
+        result = schema.execute(query, context_value=request, variables=variables)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def create_team(self, name, members=2, state="answer"):
+        team = Team.objects.create(creator=self.user, topic=self.topic, name=name)
+        team.members.add(self.user)
+        for i in range(members - 1):
+            team.members.add(User.objects.create(username=f"{name}-{i}"))
+
+        for user in team.members.all():
+            Question.objects.create(team=team, author=user, topic=self.topic, question="Q", model_answer="A")
+
+        team.current_question = team.questions.exclude(author=self.user).first()
+        Answer.objects.create(author=self.user, question=team.current_question, answer="A")
+        team.state = state
+        team.save()
+        return team
+
+    def build_fixture(self, state, members, questions):
+        """
+        Team of the user and members - 1 others in the given state, and the ids
+        the operations of BASELINE_OPERATIONS need.
+        """
+        names = [f"m{i}" for i in range(members - 1)]
+        User.objects.bulk_create([User(username=name) for name in names + ["newcomer"]])
+        users = [self.user] + list(User.objects.filter(username__in=names).order_by("pk"))
+
+        team = Team.objects.create(creator=self.user, topic=self.topic, name="team", state=state)
+        Membership.objects.bulk_create([Membership(team=team, user=user) for user in users])
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(board=board, user=user, score=i)
+            for i, user in enumerate(users) for board in (GLOBAL_BOARD, topic_board(self.topic.pk))
+        ])
+        # the teams connection gets longer with the fixture as well
+        for i in range(members // 10):
+            other = Team.objects.create(creator=self.user, topic=self.topic, name=f"other-{i}")
+            other.members.add(self.user, users[1])
+
+        if state == "question":
+            # everyone but the user, whose question starts the answer phase
+            authors = users[1:]
+        elif state in ("answer", "scoring"):
+            authors = users
+        else:
+            authors = []
+        Question.objects.bulk_create([
+            Question(team=team, author=user, topic=self.topic, question="Q", model_answer="A") for user in authors
+        ])
+
+        if state in ("answer", "scoring"):
+            # the user answers last in the answer phase and scores in the scoring phase
+            author = users[1] if state == "answer" else self.user
+            team.current_question = team.questions.get(author=author)
+            team.save()
+            Answer.objects.bulk_create([
+                Answer(author=user, question=team.current_question, answer="A")
+                for user in users if user != author and (state == "scoring" or user != self.user)
+            ])
+
+        # after the team questions, so that the first page of questions contains the answered one
+        Question.objects.bulk_create([
+            Question(author=self.user, topic=self.topic, question=f"Q{i}", model_answer="A") for i in range(questions)
+        ])
+
+        return SimpleNamespace(
+            team_id=to_global_id("TeamNode", team.pk),
+            topic_id=to_global_id("TopicNode", self.topic.pk),
+            question_id=to_global_id("QuestionNode", team.current_question_id),
+            topic_question_id=to_global_id("QuestionNode", Question.objects.filter(team=None).first().pk),
+            answer_ids=[
+                to_global_id("AnswerNode", pk)
+                for pk in Answer.objects.filter(question__team=team).order_by("pk").values_list("pk", flat=True)
+            ],
+        )
+
+
+class TeamsQueryTestCase(SchemaTestCase):
+    def test_team_fields(self):
+        team = self.create_team("a", members=3)
+        data = self.execute(TEAMS_QUERY)
+        node = data["teams"]["edges"][0]["node"]
+
+        self.assertEqual(node["id"], to_global_id("TeamNode", team.pk))
+        self.assertTrue(node["userDone"])
+        self.assertEqual(node["questionCount"], 3)
+        self.assertEqual(node["questionNumber"], 1)
+        self.assertEqual(node["creator"]["username"], "user")
+        self.assertEqual(node["topic"]["code"], "MAT")
+        self.assertEqual(len(node["members"]["edges"]), 3)
+        self.assertEqual(len(node["membershipSet"]["edges"]), 3)
+        self.assertEqual(node["currentQuestion"]["answerSet"]["edges"][0]["node"]["author"]["username"], "user")
+
+    def test_create_team(self):
+        data = self.execute("""
+            mutation($topicId: ID!) { createTeam(input: {name: "neu", topicId: $topicId}) { team { name topic { code } } } }
+        """, variables={"topicId": to_global_id("TopicNode", self.topic.pk)})
+        self.assertEqual(data["createTeam"]["team"], {"name": "neu", "topic": {"code": "MAT"}})
+
+    def test_members_filter(self):
+        self.create_team("a", members=3)
+        data = self.execute("""
+            query {
+                teams { edges { node { members(username_Icontains: "a-") { edges { node { username } } } } } }
+            }
+        """)
+        self.assertEqual(len(data["teams"]["edges"][0]["node"]["members"]["edges"]), 2)
+
+    def test_constant_query_count(self):
+        """Query count of the teams listing does not depend on the number of teams."""
+        for i in range(2):
+            self.create_team(f"small-{i}")
+
+        with CaptureQueriesContext(connection) as small:
+            self.execute(TEAMS_QUERY)
+
+        for i in range(10):
+            self.create_team(f"big-{i}", members=4)
+
+        with self.assertNumQueries(len(small.captured_queries)):
+            data = self.execute(TEAMS_QUERY)
+        self.assertEqual(len(data["teams"]["edges"]), 12)
+
+    def test_team_node(self):
+        team = self.create_team("a", members=3)
+        query = """
+            query($id: ID!) { team(id: $id) { questionCount questionNumber userDone creator { username } } }
+        """
+        with self.assertNumQueries(1):
+            data = self.execute(query, variables={"id": to_global_id("TeamNode", team.pk)})
+        self.assertEqual(data["team"], {
+            "questionCount": 3, "questionNumber": 1, "userDone": True, "creator": {"username": "user"}
+        })
+
+        stranger = User.objects.create(username="stranger")
+        request = self.factory.post("/")
+        request.user = stranger
+        result = schema.execute(query, context_value=request, variables={"id": to_global_id("TeamNode", team.pk)})
+        self.assertIsNone(result.data["team"])
+        self.assertIn("nicht in diesem Team", str(result.errors[0]))
+
+    def test_user_done_annotation(self):
+        """The annotated done flag matches Team.user_done in every phase."""
+        team = self.create_team("a", members=3)
+        other = team.members.exclude(pk=self.user.pk).first()
+
+        for state in ("open", "question", "answer", "scoring"):
+            team.state = state
+            team.save()
+            for user in (self.user, other):
+                annotated = Team.objects.with_stats(user).get(pk=team.pk)
+                self.assertEqual(annotated.is_user_done, team.user_done(user))
+
+        team.state = "question"
+        team.save()
+        team.questions.filter(author=other).delete()
+        self.assertFalse(Team.objects.with_stats(other).get(pk=team.pk).is_user_done)
+
+
+class ScoreTestCase(SchemaTestCase):
+    def test_rescoring(self):
+        team = self.create_team("a", members=2)
+        answer = Answer.objects.get(author=self.user)
+        membership = Membership.objects.get(team=team, user=self.user)
+
+        answer.set_score(3)
+        answer.set_score(3)
+        membership.refresh_from_db()
+        self.assertEqual((membership.right, membership.partial, membership.wrong), (1, 0, 0))
+
+        answer.set_score(0)
+        membership.refresh_from_db()
+        self.assertEqual((membership.right, membership.partial, membership.wrong), (0, 0, 1))
+
+        answer.set_score(None)
+        membership.refresh_from_db()
+        self.assertEqual((membership.right, membership.partial, membership.wrong), (0, 0, 0))
+
+    def test_score_mutation(self):
+        team = self.create_team("a", members=2)
+        answer = Answer.objects.get(author=self.user)
+        query = """
+            mutation($id: ID!) { scoreAnswer(input: {id: $id, score: PARTIAL}) { answer { score } } }
+        """
+        self.execute(query, user=team.current_question.author, variables={"id": to_global_id("AnswerNode", answer.pk)})
+        self.assertEqual(Membership.objects.get(team=team, user=self.user).partial, 1)
+
+    def test_score_answers_mutation(self):
+        team = self.create_team("a", members=4)
+        question = team.current_question
+        others = [user for user in team.members.all() if user not in (self.user, question.author)]
+        for user in others:
+            Answer.objects.create(author=user, question=question, answer="A")
+        answers = list(question.answer_set.order_by("pk"))
+        answers[0].set_score(3)
+
+        query = """
+            mutation($scores: [AnswerScoreInput!]!) {
+                scoreAnswers(input: {scores: $scores}) { answers { score } team { name } }
+            }
+        """
+        scores = [
+            {"id": to_global_id("AnswerNode", answers[0].pk), "score": "WRONG"},
+            {"id": to_global_id("AnswerNode", answers[1].pk), "score": "RIGHT"},
+            {"id": to_global_id("AnswerNode", answers[2].pk), "score": "PARTIAL"},
+        ]
+        saved = mock.Mock()
+        post_save.connect(saved, sender=Team)
+        try:
+            # lock, bulk update, membership update, leaderboard entries and one update per
+            # board, team update, and savepoints
+            with self.assertNumQueries(11):
+                data = self.execute(query, user=question.author, variables={"scores": scores})
+        finally:
+            post_save.disconnect(saved, sender=Team)
+
+        self.assertEqual(saved.call_count, 1)
+        self.assertEqual(data["scoreAnswers"]["team"], {"name": "a"})
+        self.assertEqual(
+            {(m.user_id, m.right, m.partial, m.wrong) for m in Membership.objects.filter(team=team).exclude(user=question.author)},
+            {(answers[0].author_id, 0, 0, 1), (answers[1].author_id, 1, 0, 0), (answers[2].author_id, 0, 1, 0)},
+        )
+
+        request = self.factory.post("/")
+        request.user = self.user
+        result = schema.execute(query, context_value=request, variables={"scores": scores})
+        self.assertEqual(result.errors[0].message, "Du musst Fragesteller sein, um diese Antwort zu bewerten.")
+
+    def test_reconcile_scores(self):
+        team = self.create_team("a", members=3)
+        Answer.objects.get(author=self.user).set_score(1)
+        Membership.objects.filter(team=team, user=self.user).update(right=5, partial=0)
+
+        out = StringIO()
+        call_command("reconcile_scores", "--dry-run", stdout=out)
+        self.assertIn("1 drifted", out.getvalue())
+        self.assertEqual(Membership.objects.get(team=team, user=self.user).right, 5)
+
+        out = StringIO()
+        call_command("reconcile_scores", stdout=out)
+        self.assertIn("3 memberships checked, 1 repaired", out.getvalue())
+        membership = Membership.objects.get(team=team, user=self.user)
+        self.assertEqual((membership.right, membership.partial, membership.wrong), (0, 1, 0))
+
+
+class NextStateTestCase(SchemaTestCase):
+    def score_round(self, team):
+        """Let every member answer the current question and score the answers round robin."""
+        scores = (3, 1, 0)
+        for i, user in enumerate(team.members.exclude(pk__in=[self.user.pk, team.current_question.author_id])):
+            Answer.objects.create(author=user, question=team.current_question, answer="A").set_score(scores[i % 3])
+        Answer.objects.get(author=self.user, question=team.current_question).set_score(3)
+        team.state = "scoring"
+        team.save()
+
+    def test_scoring(self):
+        team = self.create_team("a", members=4)
+        self.score_round(team)
+        team.next_state()
+
+        self.assertEqual(team.state, "answer")
+        self.assertEqual(team.questions.filter(done=True).count(), 1)
+        for ms in team.membership_set.all():
+            answers = Answer.objects.filter(author=ms.user, question__team=team)
+            self.assertEqual(ms.right, answers.filter(score=3).count())
+            self.assertEqual(ms.partial, answers.filter(score=1).count())
+            self.assertEqual(ms.wrong, answers.filter(score=0).count())
+        self.assertEqual(Membership.objects.get(team=team, user=self.user).right, 1)
+
+    def test_scoring_query_count(self):
+        """Query count of the scoring transition stays flat from 2 to 200 members."""
+        counts = []
+        for members in (2, 200):
+            team = self.create_team(f"team-{members}", members=members)
+            self.score_round(team)
+            team = Team.objects.get(pk=team.pk)
+            with CaptureQueriesContext(connection) as queries:
+                team.next_state()
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class PhaseTransitionTestCase(SchemaTestCase):
+    def create_open_team(self, members=3):
+        team = Team.objects.create(creator=self.user, topic=self.topic, name="a", state="question")
+        users = [self.user] + [User.objects.create(username=f"u{i}") for i in range(members - 1)]
+        team.members.add(*users)
+        return team, users
+
+    def test_post_question(self):
+        team, users = self.create_open_team()
+        for user in users[:-1]:
+            self.assertEqual(team.post_question(user, "Q", "A").state, "question")
+
+        query = """
+            mutation($id: ID!) { postQuestion(input: {id: $id, question: "Q", modelAnswer: "A"}) { team { state } } }
+        """
+        data = self.execute(query, user=users[-1], variables={"id": to_global_id("TeamNode", team.pk)})
+        self.assertEqual(data["postQuestion"]["team"]["state"], "ANSWER")
+
+        team.refresh_from_db()
+        self.assertEqual(team.current_question, team.questions.order_by("pk").first())
+        with self.assertRaises(PermissionDenied):
+            team.post_question(users[0], "Q", "A")
+
+    def test_post_answer(self):
+        team, users = self.create_open_team()
+        for user in users:
+            team.post_question(user, "Q", "A")
+        team.refresh_from_db()
+
+        answering = [user for user in users if user != team.current_question.author]
+        self.assertEqual(team.post_answer(answering[0], "A").state, "answer")
+        self.assertEqual(team.post_answer(answering[1], "A").state, "scoring")
+        with self.assertRaises(PermissionDenied):
+            team.post_answer(answering[0], "A")
+
+    def test_queries(self):
+        team, users = self.create_open_team(members=20)
+        # savepoint, lock, insert, search index, topic counter, membership check, update, release
+        with self.assertNumQueries(8):
+            team.post_question(users[0], "Q", "A")
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class PhaseConcurrencyTestCase(TransactionTestCase):
+    """Many members submitting at the same time must switch the phase exactly once."""
+
+    members = 200
+
+    def setUp(self):
+        topic = Topic.objects.create(name="Mathematik", code="MAT")
+        self.users = [User.objects.create(username=f"u{i}") for i in range(self.members)]
+        self.team = Team.objects.create(creator=self.users[0], topic=topic, name="a", state="question")
+        self.team.members.add(*self.users)
+
+    def submit_all(self, submit, users):
+        barrier = threading.Barrier(len(users))
+        errors = []
+
+        def run(user):
+            try:
+                barrier.wait()
+                submit(user)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    @override_settings(TEAM_EVENT_WINDOW=0)
+    def test_concurrent_submissions(self):
+        self.submit_all(lambda user: Team(pk=self.team.pk).post_question(user, "Q", "A"), self.users)
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.state, "answer")
+        self.assertEqual(self.team.questions.count(), self.members)
+
+        author = self.team.current_question.author
+        self.submit_all(
+            lambda user: Team(pk=self.team.pk).post_answer(user, "A"),
+            [user for user in self.users if user != author],
+        )
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.state, "scoring")
+        self.assertEqual(self.team.current_question.answer_set.count(), self.members - 1)
+
+
+class PhaseInterleavingTestCase(SchemaTestCase):
+    """
+    The race of PhaseConcurrencyTestCase, interleaved deterministically so that
+    it runs on SQLite as well: another submission commits right before a
+    submission gets the team lock.
+    """
+
+    @contextmanager
+    def committed_before_lock(self, submit):
+        select_for_update = TeamQuerySet.select_for_update
+        result = []
+
+        def locked(queryset, *args, **kwargs):
+            if not result:
+                result.append(None)
+                result[0] = submit()
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(TeamQuerySet, "select_for_update", locked):
+            yield result
+        self.assertEqual(len(result), 1)
+
+    def test_post_question(self):
+        team = Team.objects.create(creator=self.user, topic=self.topic, name="a", state="question")
+        other = User.objects.create(username="other")
+        team.members.add(self.user, other)
+        stale = Team.objects.get(pk=team.pk)
+
+        with self.committed_before_lock(lambda: Team(pk=team.pk).post_question(other, "Q", "A")) as first:
+            team = stale.post_question(self.user, "Q", "A")
+        self.assertEqual(first[0].state, "question")
+        self.assertEqual((team.state, team.current_question.author), ("answer", other))
+
+        # a submission that still sees the question phase is rejected and changes nothing
+        with self.assertRaises(PermissionDenied):
+            stale.post_question(other, "Q", "A")
+        stale.refresh_from_db()
+        self.assertEqual((stale.state, stale.current_question_id), ("answer", team.current_question_id))
+
+    def test_post_answer(self):
+        # the user has answered already, a-1 and a-2 are missing
+        team = self.create_team("a", members=4)
+        first_user, last_user = User.objects.filter(username__in=["a-1", "a-2"]).order_by("username")
+        stale = Team.objects.get(pk=team.pk)
+
+        with self.committed_before_lock(lambda: Team(pk=team.pk).post_answer(first_user, "A")) as first:
+            team = stale.post_answer(last_user, "A")
+        self.assertEqual(first[0].state, "answer")
+        self.assertEqual(team.state, "scoring")
+
+        with self.assertRaises(PermissionDenied):
+            stale.post_answer(self.user, "A")
+        self.assertEqual(team.current_question.answer_set.count(), 3)
+        stale.refresh_from_db()
+        self.assertEqual(stale.state, "scoring")
+
+
+class MembershipCacheTestCase(SchemaTestCase):
+    def test_invalidation(self):
+        team = self.create_team("a", members=2)
+        other = User.objects.create(username="other")
+        membership_cache.invalidate()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(membership_cache.is_member(team.pk, self.user.pk))
+            self.assertFalse(membership_cache.is_member(team.pk, other.pk))
+
+        team.members.add(other)
+        self.assertTrue(membership_cache.is_member(team.pk, other.pk))
+
+        other.teams.remove(team)
+        self.assertFalse(membership_cache.is_member(team.pk, other.pk))
+
+        Membership.objects.filter(team=team, user=self.user).delete()
+        self.assertFalse(membership_cache.is_member(team.pk, self.user.pk))
+
+    @override_settings(SHARED_CACHE_CHECK_INTERVAL=0)
+    def test_invalidation_across_processes(self):
+        team = self.create_team("a", members=2)
+        other = User.objects.create(username="other")
+        # the cache of another worker, the stamps go through SHARED_CACHE
+        worker = MembershipCache()
+        self.assertFalse(worker.is_member(team.pk, other.pk))
+
+        team.members.add(other)
+        self.assertTrue(worker.is_member(team.pk, other.pk))
+        other.teams.clear()
+        self.assertFalse(worker.is_member(team.pk, other.pk))
+
+    @override_settings(SHARED_CACHE_CHECK_INTERVAL=1)
+    def test_local_hits(self):
+        team = self.create_team("a", members=2)
+        other = User.objects.create(username="other")
+        worker = MembershipCache()
+        self.assertFalse(worker.is_member(team.pk, other.pk))
+        self.assertFalse(worker.is_member(team.pk, other.pk))
+
+        # hits within the interval do not read the stamps from SHARED_CACHE
+        with mock.patch.object(InvalidationStamps, "cache", new_callable=mock.PropertyMock) as cache:
+            for i in range(10):
+                self.assertFalse(worker.is_member(team.pk, other.pk))
+        cache.assert_not_called()
+
+        # the invalidation of another process is seen once the interval passed
+        team.members.add(other)
+        self.assertFalse(worker.is_member(team.pk, other.pk))
+        with mock.patch("api.cache.time.time", return_value=time.time() + 1):
+            self.assertTrue(worker.is_member(team.pk, other.pk))
+
+    def test_bounds(self):
+        team = self.create_team("a", members=2)
+        cache = MembershipCache(size=2, ttl=60)
+        for team_id in (team.pk, -1, -2):
+            cache.set(team_id, [self.user.pk])
+        self.assertEqual(list(cache.members), [-1, -2])
+
+        cache.set(team.pk, [])
+        with self.assertNumQueries(0):
+            self.assertFalse(cache.is_member(team.pk, self.user.pk))
+        with mock.patch("api.cache.time.time", return_value=time.time() + 61), self.assertNumQueries(1):
+            self.assertTrue(cache.is_member(team.pk, self.user.pk))
+
+
+class TopicQuestionCountTestCase(SchemaTestCase):
+    def assertCounts(self, **counts):
+        for code, count in counts.items():
+            self.assertEqual(Topic.objects.get(code=code).question_count, count)
+
+    def test_counter(self):
+        other = Topic.objects.create(name="Informatik", code="INF")
+        question = Question.objects.create(author=self.user, topic=self.topic, question="Q", model_answer="A")
+        self.assertCounts(MAT=1, INF=0)
+
+        question.topic = other
+        question.save()
+        question.save()
+        self.assertCounts(MAT=0, INF=1)
+
+        Question.objects.get(pk=question.pk).delete()
+        self.assertCounts(MAT=0, INF=0)
+
+        Question.objects.bulk_create([
+            Question(author=self.user, topic=self.topic, question=f"Q{i}", model_answer="A") for i in range(3)
+        ])
+        self.assertCounts(MAT=3, INF=0)
+
+        Question.objects.filter(pk__in=Question.objects.values("pk")[:2]).update(topic=other)
+        self.assertCounts(MAT=1, INF=2)
+
+        Question.objects.all().delete()
+        self.assertCounts(MAT=0, INF=0)
+
+        Question.objects.create(author=self.user, topic=other, question="Q", model_answer="A")
+        self.user.delete()
+        self.assertCounts(INF=0)
+
+    def test_bulk_update(self):
+        other = Topic.objects.create(name="Informatik", code="INF")
+        Question.objects.bulk_create([
+            Question(author=self.user, topic=self.topic, question=f"Q{i}", model_answer="A") for i in range(3)
+        ])
+        questions = list(Question.objects.order_by("pk"))
+        questions[0].topic = other
+        questions[1].topic = other
+        # topic through Case/When
+        Question.objects.bulk_update(questions, ["topic"])
+        self.assertCounts(MAT=1, INF=2)
+
+        # and through an F expression
+        Question.objects.filter(pk=questions[2].pk).update(topic=F("topic_id") + other.pk - self.topic.pk)
+        self.assertCounts(MAT=0, INF=3)
+
+    def test_ordering(self):
+        Topic.objects.create(name="Informatik", code="INF")
+        Question.objects.create(author=self.user, topic=self.topic, question="Q", model_answer="A")
+
+        with self.assertNumQueries(2):
+            data = self.execute("""
+                query { topics(orderBy: "-questionCount") { edges { node { code questionCount } } } }
+            """)
+        self.assertEqual(
+            [edge["node"] for edge in data["topics"]["edges"]],
+            [{"code": "MAT", "questionCount": 1}, {"code": "INF", "questionCount": 0}],
+        )
+
+
+class QueryPlanTestCase(SchemaTestCase):
+    """
+    The queries that the operations of BASELINE_OPERATIONS run, including the
+    team methods and the loaders behind them, must not scan whole tables.
+    """
+
+    # listings of all rows, which are paginated
+    FULL_LISTINGS = {"users": ["auth_user"], "questions": ["api_question"]}
+
+    def executed_queries(self, name):
+        state, query, variables = BASELINE_OPERATIONS[name]
+        with transaction.atomic():
+            f = self.build_fixture(state, *BASELINE_FIXTURES["10 members"])
+            with CaptureQueriesContext(connection) as queries:
+                self.execute(query, variables=variables(f))
+            transaction.set_rollback(True)
+        return [query["sql"] for query in queries.captured_queries if re.match(r"(SELECT|UPDATE|DELETE)\b", query["sql"])]
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            plan = "\n".join(row[-1] for row in cursor.fetchall())
+        # scans of subqueries in FROM are not scans of a table
+        tables = connection.introspection.table_names()
+        scans = []
+        for line in plan.splitlines():
+            match = re.search(r"\bSCAN (?:TABLE )?(\w+)(.*)", line)
+            if match and "INDEX" not in match.group(2) and match.group(1) in tables:
+                scans.append(match.group(1))
+        return scans, plan
+
+    @skipUnless(connection.vendor == "sqlite", "query plans are checked on SQLite")
+    def test_no_full_scans(self):
+        # make sure full scans are recognized in the plan
+        with CaptureQueriesContext(connection) as queries:
+            list(Question.objects.filter(question="Q"))
+        self.assertEqual(self.full_scans(queries.captured_queries[0]["sql"])[0], ["api_question"])
+
+        for name in BASELINE_OPERATIONS:
+            for sql in self.executed_queries(name):
+                with self.subTest(name, sql=sql):
+                    scans, plan = self.full_scans(sql)
+                    scans = [table for table in scans if table not in self.FULL_LISTINGS.get(name, [])]
+                    self.assertEqual(scans, [], f"full scan in {name}:\n{sql}\n{plan}")
+
+
+class QueryLimitsTestCase(SchemaTestCase):
+    QUESTIONS_QUERY = """
+        query($first: Int) {
+            questions(first: $first) {
+                edges { node { question answerSet { edges { node { answer author { username } } } } } }
+            }
+        }
+    """
+
+    def analyze(self, query, variables=None):
+        return QueryAnalysis(schema, parse(query), variables)
+
+    def test_analysis(self):
+        analysis = self.analyze(self.QUESTIONS_QUERY, {"first": 10})
+        # questions costs 2, each of the 10 questions 3 plus 20 expected answers of 3
+        self.assertEqual((analysis.depth, analysis.cost), (8, 2 + 10 * (3 + 20 * 3)))
+
+        analysis = self.analyze(TEAMS_QUERY)
+        self.assertEqual(analysis.depth, 9)
+        self.assertLess(analysis.cost, settings.GRAPHQL_QUERY_LIMITS["authenticated"][1])
+
+        fragments = self.analyze("""
+            query { teams(first: 5) { ...teams } }
+            fragment teams on TeamNodeConnection { edges { node { ... on TeamNode { topic { code } } } } }
+        """)
+        self.assertEqual((fragments.depth, fragments.cost), (5, 1 + 5 * 3))
+
+    def execute_limited(self, query, user, variables=None):
+        request = self.factory.post("/")
+        request.user = user
+        return schema.execute(query, context_value=request, variables=variables, backend=document_backend)
+
+    @override_settings(GRAPHQL_QUERY_LIMITS={"anonymous": (5, 100), "authenticated": (10, 1000), "staff": None})
+    def test_limits(self):
+        result = self.execute_limited(self.QUESTIONS_QUERY, AnonymousUser(), {"first": 10})
+        self.assertTrue(result.invalid)
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ["Query depth 8 exceeds the limit of 5.", "Query cost 632 exceeds the limit of 100."],
+        )
+
+        result = self.execute_limited(self.QUESTIONS_QUERY, self.user, {"first": 100})
+        self.assertEqual([error.message for error in result.errors], ["Query cost 6302 exceeds the limit of 1000."])
+        self.assertIsNone(self.execute_limited(self.QUESTIONS_QUERY, self.user, {"first": 10}).errors)
+
+        self.user.is_staff = True
+        self.assertIsNone(self.execute_limited(self.QUESTIONS_QUERY, self.user, {"first": 100}).errors)
+
+    @override_settings(GRAPHQL_QUERY_LIMITS={"anonymous": (5, 100), "authenticated": (10, 1000), "staff": None})
+    def test_token_header(self):
+        # the user of a JWT header is only set once the first field resolves
+        request = self.factory.post("/", HTTP_AUTHORIZATION=f"JWT {get_token(self.user)}")
+        request.user = AnonymousUser()
+        result = schema.execute(self.QUESTIONS_QUERY, context_value=request, variables={"first": 10}, backend=document_backend)
+        self.assertFalse(result.invalid)
+
+    def test_page_size(self):
+        for i in range(3):
+            Topic.objects.create(name=f"Thema {i}", code=f"T{i}")
+        query = "query($first: Int) { topics(first: $first) { edges { node { code } } pageInfo { hasNextPage } } }"
+
+        with override_settings(GRAPHQL_MAX_PAGE_SIZE=2):
+            data = self.execute(query)
+        self.assertEqual(len(data["topics"]["edges"]), 2)
+        self.assertTrue(data["topics"]["pageInfo"]["hasNextPage"])
+
+        request = self.factory.post("/")
+        request.user = self.user
+        result = schema.execute(query, context_value=request, variables={"first": settings.GRAPHQL_MAX_PAGE_SIZE + 1})
+        self.assertIn("exceeds the `first` limit", result.errors[0].message)
+
+        # nested connections get the same default page
+        team = self.create_team("a", members=3)
+        for user in team.members.exclude(pk__in=[self.user.pk, team.current_question.author_id]):
+            Answer.objects.create(author=user, question=team.current_question, answer="A")
+        with override_settings(GRAPHQL_MAX_PAGE_SIZE=1):
+            data = self.execute("""
+                query($id: ID!) {
+                    team(id: $id) {
+                        currentQuestion { answerSet { edges { node { answer } } } }
+                        membershipSet { edges { node { right } } }
+                    }
+                }
+            """, variables={"id": to_global_id("TeamNode", team.pk)})
+        self.assertEqual(len(data["team"]["currentQuestion"]["answerSet"]["edges"]), 1)
+        self.assertEqual(len(data["team"]["membershipSet"]["edges"]), 1)
+
+        # first: 0 asks for an empty page, not for the default size
+        data = self.execute("query { topics(first: 0) { edges { node { code } } } leaderboard(first: 0) { edges { node { rank } } } }")
+        self.assertEqual(data["topics"]["edges"], [])
+        self.assertEqual(data["leaderboard"]["edges"], [])
+
+    @override_settings(GRAPHQL_QUERY_LIMITS={"anonymous": (10, 100), "authenticated": (10, 1000), "staff": None})
+    def test_invalid_page_size(self):
+        # a negative page holds no items
+        analysis = self.analyze(self.QUESTIONS_QUERY, {"first": -100})
+        self.assertEqual(analysis.cost, 2)
+
+        for first in ("10", 1.5, True):
+            result = self.execute_limited(self.QUESTIONS_QUERY, self.user, {"first": first})
+            self.assertTrue(result.invalid)
+            self.assertEqual(
+                [error.message for error in result.errors],
+                ["Argument first of Query.questions must be an integer."],
+            )
+
+
+@override_settings(GRAPHQL_PROFILING=True, GRAPHQL_PROFILED_OPERATIONS={"Teams", "Topics"})
+class ProfilingTestCase(SchemaTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+
+    def post(self, query, **extra):
+        return self.client.post(
+            "/", json.dumps({"query": query}), content_type="application/json", HTTP_HOST="localhost", **extra
+        )
+
+    def test_metrics(self):
+        self.create_team("a", members=3)
+        query = TEAMS_QUERY.replace("query {", "query Teams {")
+        response = self.post(query, HTTP_AUTHORIZATION=f"JWT {get_token(self.user)}")
+        self.assertEqual(response.status_code, 200)
+
+        counts, queries = metrics.operation_queries.series["Teams"]
+        self.assertEqual(queries, 6)
+        self.assertIn("TeamNode.members", metrics.field_duration.series)
+        self.assertNotIn("TeamNode.name", metrics.field_duration.series)
+        # count and page of the connection
+        counts, queries = metrics.field_queries.series["Query.teams"]
+        self.assertEqual(queries, 2)
+
+        with override_settings(DEBUG=False, METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics/", HTTP_HOST="localhost").status_code, 403)
+            response = self.client.get("/metrics/", HTTP_HOST="localhost", HTTP_AUTHORIZATION="Bearer secret")
+        text = response.content.decode()
+        self.assertIn('graphql_operation_queries_count{operation="Teams"} 1', text)
+        self.assertIn('graphql_field_queries_sum{path="Query.teams"} 2', text)
+        self.assertIn("graphql_document_cache_misses", text)
+        self.assertIn("executor_db_queued 0", text)
+
+    def test_operation_labels(self):
+        for name in ("Topics", "Random1", "Random2"):
+            self.post(f"query {name} {{ topics {{ edges {{ node {{ code }} }} }} }}")
+        self.post("{ topics { edges { node { code } } } }")
+        self.assertEqual(sorted(metrics.operation_queries.series), ["Topics", "other"])
+        counts, queries = metrics.operation_queries.series["other"]
+        self.assertEqual(sum(counts), 3)
+
+    @override_settings(GRAPHQL_PROFILING=False)
+    def test_disabled(self):
+        self.post("query Topics { topics { edges { node { code } } } }")
+        self.assertEqual(metrics.operation_queries.series, {})
+        self.assertEqual(metrics.field_queries.series, {})
+
+    @override_settings(GRAPHQL_PROFILE_RESPONSES=True)
+    def test_response_profile(self):
+        Topic.objects.create(name="Informatik", code="INF")
+        data = self.post("query Topics { topics { edges { node { code } } } }").json()
+        profile = data["extensions"]["profile"]
+        self.assertEqual((profile["operation"], profile["queries"]), ("Topics", 2))
+        self.assertEqual([field["path"] for field in profile["fields"]][0], ["topics"])
+
+
+class TokenCacheTestCase(SchemaTestCase):
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.token = get_token(self.user)
+
+    def authenticate(self):
+        return authenticate(request=self.factory.post("/", HTTP_AUTHORIZATION=f"JWT {self.token}"))
+
+    def test_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.user)
+            self.assertEqual(get_user_by_token(self.token), self.user)
+        self.assertIsNot(self.authenticate(), self.authenticate())
+
+    def test_revocation(self):
+        self.authenticate()
+        self.user.set_password("secret")
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        user_logged_out.send(sender=User, request=None, user=self.user)
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(JSONWebTokenError):
+            self.authenticate()
+
+    def test_login_keeps_tokens(self):
+        self.authenticate()
+        # every login writes last_login
+        update_last_login(User, self.user)
+        User.objects.get(pk=self.user.pk).save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.user)
+
+    @override_settings(SHARED_CACHE_CHECK_INTERVAL=0)
+    def test_revocation_across_processes(self):
+        # the cache of another worker, the stamps go through SHARED_CACHE
+        worker = TokenCache(ttl=60)
+        worker.set(self.token, self.user)
+        self.assertEqual(worker.get(self.token), self.user)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(worker.get(self.token))
+
+    def test_local_hits(self):
+        worker = TokenCache(ttl=60)
+        worker.set(self.token, self.user)
+        self.assertEqual(worker.get(self.token), self.user)
+        with mock.patch.object(InvalidationStamps, "cache", new_callable=mock.PropertyMock) as cache:
+            for i in range(10):
+                self.assertEqual(worker.get(self.token), self.user)
+        cache.assert_not_called()
+
+    def test_expiry(self):
+        cache = TokenCache(size=2, ttl=60)
+        cache.set("expired", self.user, expires=time.time() - 1)
+        self.assertIsNone(cache.get("expired"))
+
+        for token in ("a", "b", "c"):
+            cache.set(token, self.user)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), self.user)
+
+
+class DatabaseExecutorTestCase(TestCase):
+    def test_stats(self):
+        executor = DatabaseExecutor(1, "test")
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        first = executor.submit(block)
+        second = executor.submit(lambda: None)
+        started.wait()
+        self.assertEqual((executor.stats()["running"], executor.stats()["queued"]), (1, 1))
+
+        release.set()
+        first.result()
+        second.result()
+        executor.shutdown()
+        stats = executor.stats()
+        self.assertEqual((stats["running"], stats["queued"], stats["completed"]), (0, 0, 2))
+        self.assertGreater(stats["wait_max"], 0)
+
+    def test_sync_to_async(self):
+        thread = async_to_sync(db_sync_to_async(threading.current_thread))()
+        self.assertTrue(thread.name.startswith("db"))
+
+        thread = async_to_sync(db_sync_to_async(threading.current_thread, executor=graphql_executor))()
+        self.assertTrue(thread.name.startswith("graphql-http"))
+
+    def test_health_check(self):
+        usable, dropped, closed = mock.Mock(), mock.Mock(), mock.Mock(connection=None)
+        usable.is_usable.return_value = True
+        dropped.is_usable.return_value = False
+        with mock.patch("api.executors.connections") as connections:
+            connections.all.return_value = [usable, dropped, closed]
+            check_connections()
+        usable.close.assert_not_called()
+        dropped.close.assert_called_once()
+        closed.close.assert_not_called()
+
+
+class GraphQLHttpTestCase(TransactionTestCase):
+    async def request(self, method, path, body=b""):
+        communicator = HttpCommunicator(
+            application, method, path, body=body,
+            headers=[(b"host", b"localhost"), (b"content-type", b"application/json")],
+        )
+        return await communicator.get_response()
+
+    def test_query(self):
+        Topic.objects.create(name="Mathematik", code="MAT")
+        body = json.dumps({"query": "query { topics { edges { node { code } } } }"}).encode()
+        with mock.patch.object(graphql_executor, "submit", wraps=graphql_executor.submit) as submit:
+            response = async_to_sync(self.request)("POST", "/", body)
+
+        self.assertEqual(response["status"], 200)
+        self.assertEqual(json.loads(response["body"]), {"data": {"topics": {"edges": [{"node": {"code": "MAT"}}]}}})
+        submit.assert_called_once()
+
+    def test_other_paths(self):
+        with mock.patch.object(graphql_executor, "submit") as submit:
+            response = async_to_sync(self.request)("GET", "/admin/login/")
+        self.assertEqual(response["status"], 200)
+        submit.assert_not_called()
+
+
+class SubscriptionTestCase(TransactionTestCase):
+    def setUp(self):
+        self.topic = Topic.objects.create(name="Mathematik", code="MAT")
+
+    def create_team(self, name):
+        user = User.objects.create(username=name)
+        team = Team.objects.create(creator=user, topic=self.topic, name=name)
+        team.members.add(user)
+        return team, user
+
+    async def subscribe(self, team, user, query="subscription($id: ID!) { teamUpdated(id: $id) { name } }"):
+        communicator = WebsocketCommunicator(TeamSubscriptionConsumer, "/")
+        communicator.scope["user"] = user
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({
+            "id": "1",
+            "type": "start",
+            "payload": {
+                "query": query,
+                "variables": {"id": to_global_id("TeamNode", team.pk)},
+            },
+        })
+        # wait until the subscription has been set up
+        await communicator.receive_nothing()
+        return communicator
+
+    def test_anonymous(self):
+        team, user = self.create_team("a")
+
+        async def run():
+            communicator = WebsocketCommunicator(TeamSubscriptionConsumer, "/")
+            communicator.scope["user"] = AnonymousUser()
+            await communicator.connect()
+            await communicator.send_json_to({
+                "id": "1",
+                "type": "start",
+                "payload": {
+                    "query": "subscription($id: ID!) { teamUpdated(id: $id) { name } }",
+                    "variables": {"id": to_global_id("TeamNode", team.pk)},
+                },
+            })
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response
+
+        response = async_to_sync(run)()
+        self.assertEqual(response["payload"]["errors"], ["You do not have permission to perform this action"])
+
+    def test_handlers_in_db_executor(self):
+        team, user = self.create_team("a")
+
+        async def run():
+            communicator = await self.subscribe(team, user)
+            await communicator.disconnect()
+
+        with mock.patch.object(db_executor, "submit", wraps=db_executor.submit) as submit:
+            async_to_sync(run)()
+        # connect, start and disconnect
+        self.assertEqual(submit.call_count, 3)
+
+    def test_team_fan_out(self):
+        """Team updates only reach the subscribers of that team."""
+        team_a, user_a = self.create_team("a")
+        team_b, user_b = self.create_team("b")
+
+        async def run():
+            communicator_a = await self.subscribe(
+                team_a, user_a, "subscription($id: ID!) { teamUpdated(id: $id) { name creator { username } } }"
+            )
+            communicator_b = await self.subscribe(team_b, user_b)
+
+            team_a.name = "updated"
+            saved = time.time()
+            await database_sync_to_async(team_a.save)()
+
+            response = await communicator_a.receive_json_from()
+            self.assertEqual(
+                response["payload"]["data"], {"teamUpdated": {"name": "updated", "creator": {"username": "a"}}}
+            )
+            # the commit time of the change, to measure the delivery lag
+            self.assertTrue(saved <= response["payload"]["extensions"]["committedAt"] <= time.time())
+            self.assertTrue(await communicator_b.receive_nothing())
+
+            # removed members stop receiving updates
+            await database_sync_to_async(team_a.members.remove)(user_a)
+            await database_sync_to_async(team_a.save)()
+            response = await communicator_a.receive_json_from()
+            self.assertEqual(response["payload"]["data"], {"teamUpdated": None})
+            self.assertIn("Benutzer nicht im Team", response["payload"]["errors"][0])
+
+            await communicator_a.disconnect()
+            await communicator_b.disconnect()
+
+        async_to_sync(run)()
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    @override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "qteams.layers.FakeRedisChannelLayer"}})
+    def test_redis_fan_out_across_workers(self):
+        """Events sent by another worker reach the subscribers through Redis."""
+        team, user = self.create_team("a")
+        other_worker = FakeRedisChannelLayer()
+
+        async def run():
+            communicator = await self.subscribe(team, user)
+            self.assertIsInstance(get_channel_layer(), FakeRedisChannelLayer)
+            self.assertIsNot(get_channel_layer(), other_worker)
+
+            team.name = "updated"
+            await database_sync_to_async(Team.objects.filter(pk=team.pk).update)(name="updated")
+            event = await database_sync_to_async(TeamSubscriptionEvent)(operation=UPDATED, instance=team)
+            await other_worker.group_send(team_group_name(team.pk), {"type": "signal.fired", "event": event.to_dict()})
+
+            response = await communicator.receive_json_from(timeout=5)
+            self.assertEqual(response["payload"]["data"], {"teamUpdated": {"name": "updated"}})
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    @override_settings(SHARED_SUBSCRIPTION_RESULTS=True)
+    def test_shared_results(self):
+        """Subscribers of a team share one execution with their own viewer fields."""
+        team, creator = self.create_team("a")
+        member = User.objects.create(username="member")
+        team.members.add(member)
+        team.state = "question"
+        team.save()
+        Question.objects.create(team=team, author=member, topic=self.topic, question="Q", model_answer="A")
+
+        query = """
+            subscription($id: ID!) {
+                teamUpdated(id: $id) { name userDone members { edges { node { username isMe } } } }
+            }
+        """
+
+        async def run():
+            communicators = [
+                await self.subscribe(team, creator, query),
+                await self.subscribe(team, member, query),
+            ]
+            hits, misses = shared_results.hits, shared_results.misses
+
+            team.name = "updated"
+            await database_sync_to_async(team.save)()
+
+            responses = [await communicator.receive_json_from() for communicator in communicators]
+            for communicator in communicators:
+                await communicator.disconnect()
+            return responses, shared_results.hits - hits, shared_results.misses - misses
+
+        responses, hits, misses = async_to_sync(run)()
+
+        creator_data, member_data = [response["payload"]["data"]["teamUpdated"] for response in responses]
+        self.assertEqual(creator_data["name"], "updated")
+        self.assertFalse(creator_data["userDone"])
+        self.assertTrue(member_data["userDone"])
+        self.assertEqual(
+            [edge["node"]["isMe"] for edge in creator_data["members"]["edges"]], [True, False]
+        )
+        self.assertEqual(
+            [edge["node"]["isMe"] for edge in member_data["members"]["edges"]], [False, True]
+        )
+        # creator and member have different roles, a second member would be a hit
+        self.assertEqual((hits, misses), (0, 2))
+
+    def test_coalesced_events(self):
+        """A burst of team updates is sent as one event with the final state."""
+        team, user = self.create_team("a")
+        sent = []
+        done = threading.Event()
+
+        def send(event):
+            sent.append(event)
+            done.set()
+
+        with self.settings(TEAM_EVENT_WINDOW=50), \
+                mock.patch.object(TeamSubscriptionEvent, "send", autospec=True, side_effect=send):
+            start = time.time()
+            for i in range(5):
+                team.name = f"update {i}"
+                team.save()
+                if i == 0:
+                    first_saved = time.time()
+            self.assertTrue(done.wait(timeout=5))
+            time.sleep(0.1)
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0].operation, UPDATED)
+        self.assertEqual(sent[0].instance.name, "update 4")
+        self.assertEqual(sent[0].member_ids, [user.pk])
+        # the lag of the merged event is counted from the first change
+        self.assertTrue(start <= sent[0].committed_at <= first_saved)
+
+
+class LoadTestCommandTestCase(SimpleTestCase):
+    def test_smoke(self):
+        """One team plays one round against a daphne on its own database."""
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, QTEAMS_DATABASE=os.path.join(directory, "db.sqlite3"))
+            manage = [sys.executable, os.path.join(settings.BASE_DIR, "manage.py")]
+            subprocess.run(manage + ["migrate", "-v", "0"], env=env, check=True, capture_output=True, timeout=120)
+            result = subprocess.run(
+                manage + ["loadtest", "--teams", "1", "--members", "2", "--http-concurrency", "1"],
+                env=env, capture_output=True, text=True, timeout=120,
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        lines = dict(line.split(": ", 1) for line in result.stdout.splitlines() if ": " in line)
+        for name in ("CreateTeam", "AddMember", "NextPhase", "PostQuestion", "PostAnswer", "ScoreAnswers"):
+            self.assertIn(" 0 errors", lines[name])
+            self.assertIn("queries", lines[name])
+        # every member receives the events of the round, with their lag since the commit
+        events = int(lines["teamUpdated"].split()[0])
+        self.assertGreater(events, 0)
+        self.assertIn("lag since commit p50", lines["teamUpdated"])
+
+
+class PersistedQueryTestCase(TestCase):
+    query = "query Topics { topics { edges { node { code } } } }"
+
+    def post(self, **data):
+        return self.client.post("/", json.dumps(data), content_type="application/json").json()
+
+    def test_persisted_query(self):
+        Topic.objects.create(name="Mathematik", code="MAT")
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": document_hash(self.query)}}
+
+        response = self.post(extensions=extensions)
+        self.assertEqual(response["errors"][0]["message"], "PersistedQueryNotFound")
+
+        response = self.post(query=self.query, extensions=extensions)
+        self.assertEqual(response["data"]["topics"]["edges"], [{"node": {"code": "MAT"}}])
+
+        hits = document_backend.hits
+        response = self.post(extensions=extensions)
+        self.assertEqual(response["data"]["topics"]["edges"], [{"node": {"code": "MAT"}}])
+        self.assertEqual(document_backend.hits, hits + 1)
+
+    def test_hash_mismatch(self):
+        response = self.client.post("/", json.dumps({
+            "query": self.query,
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}},
+        }), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_validation_errors_are_cached(self):
+        for i in range(2):
+            response = self.post(query="{ unknownField }")
+            self.assertIn("unknownField", response["errors"][0]["message"])
+
+
+class SearchTestCase(SchemaTestCase):
+    def create_question(self, question, model_answer="Antwort"):
+        return Question.objects.create(author=self.user, topic=self.topic, question=question, model_answer=model_answer)
+
+    def search(self, value):
+        data = self.execute("""
+            query($query: String) { questions(query: $query) { edges { node { question } } } }
+        """, variables={"query": value})
+        return [edge["node"]["question"] for edge in data["questions"]["edges"]]
+
+    def test_search(self):
+        self.create_question("Was ist eine Matrix?")
+        self.create_question("Was ist ein Vektor?", "Ein Vektor ist eine einspaltige Matrix")
+        self.create_question("Was ist Rekursion?")
+
+        self.assertEqual(self.search("Rekursion"), ["Was ist Rekursion?"])
+        self.assertEqual(self.search("Rekurs"), ["Was ist Rekursion?"])
+        self.assertEqual(set(self.search("matrix")), {"Was ist eine Matrix?", "Was ist ein Vektor?"})
+        self.assertEqual(self.search("Vektor Matrix"), ["Was ist ein Vektor?"])
+        self.assertEqual(self.search('"*'), ["Was ist eine Matrix?", "Was ist ein Vektor?", "Was ist Rekursion?"])
+
+        # the index is joined and matched once, not once per result row
+        with CaptureQueriesContext(connection) as queries:
+            self.search("matrix")
+        page = [query["sql"] for query in queries.captured_queries if "api_question_search" in query["sql"]][-1]
+        self.assertEqual(page.count("MATCH"), 1)
+
+    def test_index_sync(self):
+        question = self.create_question("Was ist eine Matrix?")
+        question.question = "Was ist ein Graph?"
+        question.save()
+        self.assertEqual(self.search("Matrix"), [])
+        self.assertEqual(self.search("Graph"), ["Was ist ein Graph?"])
+
+        question.delete()
+        self.assertEqual(self.search("Graph"), [])
+
+    def test_reindex_on_text_change(self):
+        question = Question.objects.get(pk=self.create_question("Was ist eine Matrix?").pk)
+        question.done = True
+        with CaptureQueriesContext(connection) as queries:
+            question.save()
+        self.assertFalse([query for query in queries.captured_queries if "api_question_search" in query["sql"]])
+
+        question.model_answer = "Ein Graph"
+        question.save()
+        self.assertEqual(self.search("Graph"), ["Was ist eine Matrix?"])
+
+    def test_rebuild(self):
+        Question.objects.bulk_create([
+            Question(author=self.user, topic=self.topic, question=f"Frage {i}", model_answer="Baum")
+            for i in range(3)
+        ])
+        self.assertEqual(self.search("Baum"), [])
+
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("3 questions indexed", out.getvalue())
+        self.assertEqual(len(self.search("Baum")), 3)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command("benchmark_search", questions=50, batch_size=20, repeat=1, stdout=out)
+        self.assertIn("full-text", out.getvalue())
+        self.assertFalse(Question.objects.filter(topic__code="BENCH").exists())
+
+
+class LeaderboardTestCase(SchemaTestCase):
+    LEADERBOARD_QUERY = """
+        query($topic: ID, $first: Int, $after: String) {
+            leaderboard(topic: $topic, first: $first, after: $after) {
+                edges { cursor node { rank score user { username } } }
+                pageInfo { hasNextPage }
+            }
+            myRank(topic: $topic) { rank score }
+        }
+    """
+
+    def scores(self, board=GLOBAL_BOARD):
+        return dict(LeaderboardEntry.objects.filter(board=board).values_list("user__username", "score"))
+
+    def scored_team(self):
+        team = self.create_team("a", members=3, state="scoring")
+        for user in team.members.exclude(pk=team.current_question.author_id):
+            Answer.objects.get_or_create(author=user, question=team.current_question, defaults={"answer": "A"})
+        return team
+
+    def test_scores(self):
+        team = self.scored_team()
+        answers = {answer.author.username: answer for answer in team.current_question.answer_set.all()}
+
+        answers["user"].set_score(3)
+        self.assertEqual(self.scores(), {"user": 3})
+        self.assertEqual(self.scores(topic_board(self.topic.pk)), {"user": 3})
+
+        answers["user"].set_score(1)
+        Answer.objects.set_scores(
+            {answer.pk: 3 for answer in answers.values()}, team.current_question.author
+        )
+        self.assertEqual(self.scores(), {"user": 3, "a-1": 3})
+
+        other_topic = Topic.objects.create(name="Physik", code="PHY")
+        team.current_question.topic = other_topic
+        team.current_question.save()
+        Answer.objects.set_scores({answers["user"].pk: 0}, team.current_question.author)
+        self.assertEqual(self.scores(), {"user": 0, "a-1": 3})
+        self.assertEqual(self.scores(topic_board(other_topic.pk)), {"user": -3})
+
+        call_command("rebuild_leaderboard", stdout=StringIO())
+        self.assertEqual(self.scores(), {"a-1": 3})
+        self.assertEqual(self.scores(topic_board(other_topic.pk)), {"a-1": 3})
+        self.assertEqual(self.scores(topic_board(self.topic.pk)), {})
+
+    def test_deletes(self):
+        team = self.scored_team()
+        Answer.objects.set_scores(
+            {answer.pk: 3 for answer in team.current_question.answer_set.all()}, team.current_question.author
+        )
+        team.current_question.delete()
+        self.assertEqual(self.scores(), {"user": 0, "a-1": 0})
+
+        Answer.objects.set_scores({
+            Answer.objects.create(author=self.user, question=team.questions.exclude(author=self.user).first(), answer="A").pk: 1
+        }, team.questions.exclude(author=self.user).first().author)
+        self.topic.delete()
+        self.assertEqual(self.scores(), {"user": 0, "a-1": 0})
+        self.assertFalse(LeaderboardEntry.objects.exclude(board=GLOBAL_BOARD).exists())
+
+    def test_query(self):
+        users = [User.objects.create(username=f"u{i}") for i in range(5)]
+        LeaderboardEntry.objects.add_scores({(user.pk, self.topic.pk): i for i, user in enumerate(users, 1)})
+        LeaderboardEntry.objects.add_scores({(self.user.pk, self.topic.pk): 4})
+        topic_id = to_global_id("TopicNode", self.topic.pk)
+
+        data = self.execute(self.LEADERBOARD_QUERY, variables={"topic": topic_id, "first": 3})
+        edges = data["leaderboard"]["edges"]
+        self.assertEqual(
+            [(edge["node"]["rank"], edge["node"]["user"]["username"], edge["node"]["score"]) for edge in edges],
+            [(1, "u4", 5), (2, "user", 4), (3, "u3", 4)],
+        )
+        self.assertTrue(data["leaderboard"]["pageInfo"]["hasNextPage"])
+        self.assertEqual(data["myRank"], {"rank": 2, "score": 4})
+
+        data = self.execute(self.LEADERBOARD_QUERY, variables={"first": 3, "after": edges[-1]["cursor"]})
+        self.assertEqual([edge["node"]["rank"] for edge in data["leaderboard"]["edges"]], [4, 5, 6])
+        self.assertFalse(data["leaderboard"]["pageInfo"]["hasNextPage"])
+
+        data = self.execute(self.LEADERBOARD_QUERY, user=AnonymousUser())
+        self.assertEqual(len(data["leaderboard"]["edges"]), 6)
+        self.assertIsNone(data["myRank"])
+
+        # backwards pagination is not supported, rather than ignored
+        request = self.factory.post("/")
+        request.user = self.user
+        for arguments in ("last: 2", f'before: "{edges[-1]["cursor"]}"'):
+            result = schema.execute(f"query {{ leaderboard({arguments}) {{ edges {{ node {{ rank }} }} }} }}", context_value=request)
+            self.assertEqual(
+                [error.message for error in result.errors],
+                ["The leaderboard is only paginated forwards, with first and after."],
+            )
+
+
+class UserTopicStatsTestCase(SchemaTestCase):
+    USERS_QUERY = """
+        query {
+            users(username_Icontains: "a-") {
+                edges { node { username topicStats { topic { code } answers right partial wrong questions } } }
+            }
+        }
+    """
+
+    def stats(self):
+        return {
+            (row.user.username, row.topic.code): tuple(getattr(row, field) for field in STAT_FIELDS)
+            for row in UserTopicStats.objects.select_related("user", "topic")
+        }
+
+    def finish_question(self, team):
+        for user in team.members.exclude(pk=team.current_question.author_id):
+            answer, _ = Answer.objects.get_or_create(author=user, question=team.current_question, defaults={"answer": "A"})
+            answer.set_score(3 if user == self.user else 0)
+        team.next_state()
+
+    def test_next_state(self):
+        team = self.create_team("a", members=3, state="scoring")
+        author = team.current_question.author.username
+        other = team.members.exclude(username__in=["user", author]).get().username
+        self.finish_question(team)
+        # answers, right, partial, wrong, questions
+        self.assertEqual(self.stats(), {
+            ("user", "MAT"): (1, 1, 0, 0, 0),
+            (other, "MAT"): (1, 0, 0, 1, 0),
+            (author, "MAT"): (0, 0, 0, 0, 1),
+        })
+
+        data = self.execute(self.USERS_QUERY)
+        topic_stats = {edge["node"]["username"]: edge["node"]["topicStats"] for edge in data["users"]["edges"]}
+        self.assertEqual(topic_stats[author], [
+            {"topic": {"code": "MAT"}, "answers": 0, "right": 0, "partial": 0, "wrong": 0, "questions": 1}
+        ])
+        self.assertEqual(topic_stats[other][0]["wrong"], 1)
+
+        Question.objects.get(author__username=author).delete()
+        self.assertEqual(set(self.stats().values()), {(0, 0, 0, 0, 0)})
+
+    def test_backfill(self):
+        team = self.create_team("a", members=3, state="scoring")
+        self.finish_question(team)
+        self.finish_question(team)
+        expected = self.stats()
+        other_topic = Topic.objects.create(name="Physik", code="PHY")
+        UserTopicStats.objects.update(answers=7)
+        UserTopicStats.objects.create(user=self.user, topic=other_topic, answers=1)
+        UserTopicStats.objects.filter(user__username="a-0").delete()
+
+        out = StringIO()
+        call_command("backfill_user_stats", batch_size=1, stdout=out)
+        self.assertEqual(self.stats(), expected)
+        self.assertEqual(out.getvalue().strip(), "2 user statistics updated, 1 created, 1 removed.")
+
+    def test_query_count(self):
+        """Counting a question takes the same queries for first-time and returning authors."""
+        team = self.create_team("a", members=200, state="scoring")
+        question = team.current_question
+        Answer.objects.bulk_create([
+            Answer(author=user, question=question, answer="A", score=3)
+            for user in team.members.exclude(pk__in=[question.author_id, self.user.pk])
+        ])
+        # the answers, the rows of new users and one UPDATE
+        with self.assertNumQueries(3):
+            UserTopicStats.objects.add_question(question)
+        self.assertEqual(UserTopicStats.objects.count(), 200)
+        with self.assertNumQueries(3):
+            UserTopicStats.objects.add_question(question)
+        self.assertEqual(UserTopicStats.objects.get(user=question.author).questions, 2)
+        self.assertEqual(UserTopicStats.objects.filter(right=2).count(), 198)
+
+    def test_rescore(self):
+        """Scores changed after the question is finished move the statistics as well."""
+        team = self.create_team("a", members=4, state="scoring")
+        question = team.current_question
+        self.finish_question(team)
+
+        Answer.objects.get(question=question, author=self.user).set_score(1)
+        answers = Answer.objects.filter(question=question).exclude(author=self.user)
+        Answer.objects.set_scores({answer.pk: 3 for answer in answers}, question.author)
+        Answer.objects.set_scores({answers[0].pk: None}, question.author)
+
+        stats = self.stats()
+        self.assertEqual(stats["user", "MAT"], (1, 0, 1, 0, 0))
+        call_command("backfill_user_stats", stdout=StringIO())
+        self.assertEqual(self.stats(), stats)
+
+
+class ArchiveTestCase(SchemaTestCase):
+    def finished_team(self):
+        team = self.create_team("a", members=3, state="scoring")
+        while team.state != "done":
+            for user in team.members.exclude(pk=team.current_question.author_id):
+                answer, _ = Answer.objects.get_or_create(author=user, question=team.current_question, defaults={"answer": "A"})
+                answer.set_score(3 if user == self.user else 1)
+            team.state = "scoring"
+            team.next_state()
+        return team
+
+    def test_archive(self):
+        team = self.finished_team()
+        scores = set(LeaderboardEntry.objects.values_list("board", "user_id", "score"))
+        stats = set(UserTopicStats.objects.values_list("user_id", "topic_id", *STAT_FIELDS))
+
+        out = StringIO()
+        call_command("archive_rounds", days=0, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "1 teams archived, 6 answers moved.")
+        team.refresh_from_db()
+        self.assertEqual(team.state, "archived")
+        self.assertFalse(Answer.objects.exists())
+        self.assertEqual(Question.objects.filter(team=None).count(), 3)
+        self.assertEqual(list(team.membership_set.values_list("right", "partial", "wrong")), [(0, 0, 0)] * 3)
+
+        archived = team.archived_rounds.get()
+        records = archived.records()
+        self.assertEqual(
+            sorted(record["membership"]["right"] for record in records if "membership" in record), [0, 0, 2]
+        )
+        questions = [record for record in records if "question" in record]
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(sum(len(record["answers"]) for record in questions), archived.answers)
+
+        call_command("rebuild_leaderboard", stdout=StringIO())
+        call_command("backfill_user_stats", stdout=StringIO())
+        self.assertEqual(set(LeaderboardEntry.objects.values_list("board", "user_id", "score")), scores)
+        self.assertEqual(set(UserTopicStats.objects.values_list("user_id", "topic_id", *STAT_FIELDS)), stats)
+
+        team.next_state()
+        self.assertEqual(team.state, "question")
+        self.assertEqual(ArchivedRound.objects.count(), 1)
+
+    def test_recent_teams(self):
+        self.finished_team()
+        out = StringIO()
+        call_command("archive_rounds", dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "0 teams to archive.")
+        call_command("archive_rounds", days=0, dry_run=True, stdout=out)
+        self.assertIn("1 teams to archive.", out.getvalue())
+        self.assertEqual(Answer.objects.count(), 6)
+
+    def test_restart(self):
+        team = self.finished_team()
+        team.next_state()
+        self.assertEqual(team.state, "question")
+        self.assertEqual(ArchivedRound.objects.get().questions, 3)
+        self.assertFalse(team.questions.exists())
+        self.assertFalse(Answer.objects.exists())
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class RedisLeaderboardTestCase(TransactionTestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        patcher = mock.patch("api.leaderboard.redis_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.topic = Topic.objects.create(name="Mathematik", code="MAT")
+        self.users = [User.objects.create(username=f"u{i}") for i in range(3)]
+
+    @override_settings(LEADERBOARD_BACKEND="redis")
+    def test_mirror(self):
+        backend = get_leaderboard_backend()
+        LeaderboardEntry.objects.add_scores({(user.pk, self.topic.pk): i for i, user in enumerate(self.users, 1)})
+        with transaction.atomic():
+            LeaderboardEntry.objects.add_scores({(self.users[0].pk, self.topic.pk): 5})
+            transaction.set_rollback(True)
+
+        self.assertEqual(backend.page(GLOBAL_BOARD, 0, 2), [(1, self.users[2].pk, 3), (2, self.users[1].pk, 2)])
+        self.assertEqual(backend.rank(topic_board(self.topic.pk), self.users[0].pk), (3, self.users[0].pk, 1))
+
+        user_id, topic_id = self.users[2].pk, self.topic.pk
+        self.users[2].delete()
+        self.assertIsNone(backend.rank(GLOBAL_BOARD, user_id))
+        self.topic.delete()
+        self.assertEqual(backend.page(topic_board(topic_id), 0, 10), [])
+
+        # rebuilt from the scored answers, which bulk_create added without signals
+        topic = Topic.objects.create(name="Physik", code="PHY")
+        question = Question.objects.create(author=self.users[0], topic=topic, question="Q", model_answer="A")
+        Answer.objects.bulk_create([Answer(author=self.users[1], question=question, answer="A", score=3)])
+        self.assertEqual(backend.rebuild(), 2)
+        self.assertEqual(backend.page(GLOBAL_BOARD, 0, 10), [(1, self.users[1].pk, 3)])
+        self.assertEqual(backend.page(topic_board(topic.pk), 0, 10), [(1, self.users[1].pk, 3)])
+
+    def test_ties(self):
+        """Both backends order users with the same score by user id."""
+        self.users += [User.objects.create(username=f"u{i}") for i in range(3, 12)]
+        question = Question.objects.create(author=self.users[0], topic=self.topic, question="Q", model_answer="A")
+        # many equal scores, created in descending user id
+        Answer.objects.bulk_create([
+            Answer(author=user, question=question, answer="A", score=1 + i % 3)
+            for i, user in enumerate(reversed(self.users))
+        ])
+        with override_settings(LEADERBOARD_BACKEND="redis"):
+            redis_backend = get_leaderboard_backend()
+            redis_backend.rebuild()
+            # and changed through the mirror
+            LeaderboardEntry.objects.add_scores({(self.users[5].pk, self.topic.pk): 1})
+        database_backend = get_leaderboard_backend()
+
+        expected = database_backend.page(GLOBAL_BOARD, 0, 20)
+        self.assertEqual(len(expected), len(self.users))
+        self.assertEqual(redis_backend.page(GLOBAL_BOARD, 0, 20), expected)
+        self.assertEqual(redis_backend.page(GLOBAL_BOARD, 3, 4), expected[3:7])
+        for ranking in expected:
+            self.assertEqual(redis_backend.rank(GLOBAL_BOARD, ranking.user_id), ranking)
+            self.assertEqual(database_backend.rank(GLOBAL_BOARD, ranking.user_id), ranking)
+
+
+TEAM_FIELDS = """
+fragment TeamFields on TeamNode {
+    name
+    state
+    mode
+    userDone
+    questionCount
+    questionNumber
+    creator { username }
+    topic { code }
+    currentQuestion {
+        question
+        author { username }
+        answerSet { edges { node { answer score author { username } } } }
+    }
+    members { edges { node { username isMe } } }
+    membershipSet { edges { node { score right partial wrong user { username } } } }
+}
+"""
+
+QUESTION_FIELDS = """
+fragment QuestionFields on QuestionNode {
+    question
+    modelAnswer
+    author { username }
+    topic { code }
+    answerSet { edges { node { answer author { username } } } }
+}
+"""
+
+# name: (team state of the fixture, document, variables for the fixture)
+BASELINE_OPERATIONS = {
+    "nextPhase": ("open", """
+        mutation($id: ID!) { nextPhase(input: {id: $id}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "nextPhase scoring": ("scoring", """
+        mutation($id: ID!) { nextPhase(input: {id: $id}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "postQuestion": ("question", """
+        mutation($id: ID!) { postQuestion(input: {id: $id, question: "Q", modelAnswer: "A"}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "postAnswer": ("answer", """
+        mutation($id: ID!) { postAnswer(input: {id: $id, answer: "A"}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "updateQuestion": ("scoring", """
+        mutation($id: ID!) { updateQuestion(input: {id: $id, question: "Q", modelAnswer: "A"}) { question { ...QuestionFields } } }
+    """ + QUESTION_FIELDS, lambda f: {"id": f.question_id}),
+    "scoreAnswer": ("scoring", """
+        mutation($id: ID!) { scoreAnswer(input: {id: $id, score: RIGHT}) { answer { answer score author { username } } } }
+    """, lambda f: {"id": f.answer_ids[0]}),
+    "scoreAnswers": ("scoring", """
+        mutation($scores: [AnswerScoreInput!]!) {
+            scoreAnswers(input: {scores: $scores}) { answers { score } team { ...TeamFields } }
+        }
+    """ + TEAM_FIELDS, lambda f: {"scores": [{"id": id, "score": "RIGHT"} for id in f.answer_ids]}),
+    "createTeam": ("open", """
+        mutation($topicId: ID!) { createTeam(input: {name: "new", topicId: $topicId}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"topicId": f.topic_id}),
+    "addMember": ("open", """
+        mutation($id: ID!) { addMember(input: {teamId: $id, username: "newcomer"}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "removeMember": ("open", """
+        mutation($id: ID!) { removeMember(input: {teamId: $id, username: "m0"}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "removeQuestion": ("open", """
+        mutation($id: ID!) { removeQuestion(input: {id: $id}) { question { question } } }
+    """, lambda f: {"id": f.topic_question_id}),
+    "setMode": ("open", """
+        mutation($id: ID!) { setMode(input: {teamId: $id, mode: COMPETITION}) { team { ...TeamFields } } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "team": ("answer", """
+        query($id: ID!) { team(id: $id) { ...TeamFields } }
+    """ + TEAM_FIELDS, lambda f: {"id": f.team_id}),
+    "teams": ("answer", """
+        query { teams { edges { node { ...TeamFields } } } }
+    """ + TEAM_FIELDS, lambda f: {}),
+    "topics": ("open", """
+        query { topics { edges { node { code name questionCount } } } }
+    """, lambda f: {}),
+    "questions": ("scoring", """
+        query { questions { edges { node { ...QuestionFields } } } }
+    """ + QUESTION_FIELDS, lambda f: {}),
+    "users": ("open", """
+        query { users { edges { node { username isMe topicStats { topic { code } answers right questions } } } } }
+    """, lambda f: {}),
+    "leaderboard": ("open", """
+        query($topic: ID) {
+            leaderboard(topic: $topic) { edges { node { rank score user { username } } } pageInfo { hasNextPage } }
+            myRank(topic: $topic) { rank score }
+        }
+    """, lambda f: {"topic": f.topic_id}),
+}
+
+# name: (members of the team, questions of the topic outside the team)
+BASELINE_FIXTURES = {
+    "2 members": (2, 10),
+    "10 members": (10, 10),
+    "100 members": (100, 10),
+    "1000 questions": (2, 1000),
+}
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "query_baselines.json")
+
+
+def sql_shape(sql):
+    """The query without its values, so that it does not depend on ids, names or list lengths."""
+    sql = re.sub(r"'(?:[^']|'')*'", "%s", sql)
+    sql = re.sub(r'"s\d+_x\d+"', '"savepoint"', sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "%s", sql)
+    # one row per object of a bulk insert, SQLite selects the rows to ignore conflicts
+    sql = re.sub(r"VALUES (\([^()]*\))(, \1)+", r"VALUES \1, ...", sql)
+    sql = re.sub(r"(SELECT %s(, %s)*)( UNION ALL \1)+", r"\1 UNION ALL ...", sql)
+    # one WHEN per row of a bulk update
+    sql = re.sub(r"(WHEN .+? THEN %s )\1+", r"\1", sql)
+    return re.sub(r"IN \(%s(, %s)*\)", "IN (...)", sql)
+
+
+class QueryBaselineTestCase(SchemaTestCase):
+    """
+    Queries of every mutation and connection on fixtures of increasing size,
+    compared with the baselines in api/query_baselines.json.
+
+    Every operation must run the queries of its baseline on every fixture,
+    more members or questions must not mean more queries. After an intended
+    change, update the baselines with
+    QTEAMS_UPDATE_QUERY_BASELINES=1 ./manage.py test api.tests.QueryBaselineTestCase
+    and review the diff of the file.
+    """
+
+    maxDiff = None
+
+    def measure(self, name, fixture):
+        state, query, variables = BASELINE_OPERATIONS[name]
+        with transaction.atomic():
+            f = self.build_fixture(state, *BASELINE_FIXTURES[fixture])
+            with CaptureQueriesContext(connection) as queries:
+                self.execute(query, variables=variables(f))
+            transaction.set_rollback(True)
+        return [sql_shape(query["sql"]) for query in queries.captured_queries]
+
+    def test_covers_schema(self):
+        """New mutations and connections need a baseline."""
+        root_fields = {name.split()[0] for name in BASELINE_OPERATIONS}
+        mutations = {to_camel_case(name) for name in api_schema.Mutation._meta.fields}
+        connections = {
+            name for name, field in schema.get_query_type().fields.items()
+            if QueryAnalysis.is_connection(field.type) and to_snake_case(name) in api_schema.Query._meta.fields
+        }
+        self.assertEqual(mutations - root_fields, set())
+        self.assertEqual(connections - root_fields, set())
+
+    def test_baselines(self):
+        shapes = {name: {fixture: self.measure(name, fixture) for fixture in BASELINE_FIXTURES} for name in BASELINE_OPERATIONS}
+
+        if os.environ.get("QTEAMS_UPDATE_QUERY_BASELINES"):
+            with open(BASELINE_FILE, "w") as f:
+                json.dump({name: fixtures["2 members"] for name, fixtures in shapes.items()}, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+
+        for name, fixtures in shapes.items():
+            counts = {fixture: len(queries) for fixture, queries in fixtures.items()}
+            for fixture, queries in fixtures.items():
+                with self.subTest(name, fixture=fixture):
+                    self.assertEqual(queries, baselines.get(name), f"{name} on {fixture}, queries per fixture: {counts}")
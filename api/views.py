@@ -1,3 +1,119 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.conf import settings
+from django.core.cache import caches
+from graphene_django.views import GraphQLView, HttpError
+from graphql.error import GraphQLError
+from graphql.execution import ExecutionResult
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+
+from api.backend import document_backend, document_hash
+from api.cache import token_cache
+from api.executors import db_executor, graphql_executor
+from api.metrics import metrics
+from api.subscriptions import shared_results
+
+
+class PersistedQueries:
+    """Query documents by hash, stored in the PERSISTED_QUERIES_CACHE cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[settings.PERSISTED_QUERIES_CACHE]
+
+    def get(self, query_hash):
+        query = self.cache.get(f"persisted-query:{query_hash}")
+        if query is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return query
+
+    def add(self, query_hash, query):
+        self.cache.set(f"persisted-query:{query_hash}", query, settings.PERSISTED_QUERIES_TIMEOUT)
+
+
+persisted_queries = PersistedQueries()
+
+
+class PersistedQueryGraphQLView(GraphQLView):
+    """
+    GraphQL view with automatic persisted queries.
+
+    A client may send only the sha256 hash of a document in
+    ``extensions.persistedQuery.sha256Hash``. Unknown hashes are answered
+    with a ``PersistedQueryNotFound`` error, after which the client sends
+    hash and document together and the document is stored for later
+    requests. Documents are parsed and validated once by document_backend.
+    """
+
+    def __init__(self, backend=None, **kwargs):
+        super().__init__(backend=backend or document_backend, **kwargs)
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions") or {}
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        if settings.GRAPHQL_PROFILE_RESPONSES:
+            request.graphql_profile = []
+
+        persisted_query = self.get_extensions(request, data).get("persistedQuery")
+
+        if persisted_query:
+            query_hash = persisted_query.get("sha256Hash")
+            if query:
+                if document_hash(query) != query_hash:
+                    return ExecutionResult(errors=[GraphQLError("provided sha does not match query")], invalid=True)
+                persisted_queries.add(query_hash, query)
+            else:
+                query = persisted_queries.get(query_hash)
+                if query is None:
+                    return ExecutionResult(errors=[GraphQLError("PersistedQueryNotFound")])
+
+        return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+    def json_encode(self, request, d, pretty=False):
+        profile = getattr(request, "graphql_profile", None)
+        if profile is not None:
+            d["extensions"] = {"profile": dict(getattr(request, "graphql_operation", {}), fields=profile)}
+        return super().json_encode(request, d, pretty)
+
+
+def metrics_view(request):
+    """
+    Resolver and operation histograms and cache and executor statistics in
+    the Prometheus text format. Outside of DEBUG, the request needs
+    "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    if not settings.DEBUG and (
+        not settings.METRICS_TOKEN
+        or request.META.get("HTTP_AUTHORIZATION") != f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        return HttpResponseForbidden()
+
+    gauges = {
+        "graphql_persisted_query_hits": persisted_queries.hits,
+        "graphql_persisted_query_misses": persisted_queries.misses,
+        "jwt_cache_hits": token_cache.hits,
+        "jwt_cache_misses": token_cache.misses,
+        "subscription_shared_result_hits": shared_results.hits,
+        "subscription_shared_result_misses": shared_results.misses,
+    }
+    for key, value in document_backend.stats().items():
+        gauges[f"graphql_document_cache_{key}"] = value
+    for executor in (db_executor, graphql_executor):
+        for key, value in executor.stats().items():
+            gauges[f"executor_{executor.name.replace('-', '_')}_{key}"] = value
+
+    return HttpResponse(metrics.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
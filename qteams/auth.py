@@ -1,15 +1,51 @@
+import time
+
 from django.db import close_old_connections
 from django.contrib.auth import authenticate, login
+from graphql_jwt import backends
 from graphql_jwt.settings import jwt_settings
-from graphql_jwt.shortcuts import get_user_by_token
+from graphql_jwt.utils import get_credentials, get_payload, get_user_by_payload
 from django.contrib.auth.models import AnonymousUser
-from channels.db import database_sync_to_async
+from api.cache import token_cache
+from api.executors import db_sync_to_async
 from asgiref.sync import sync_to_async
 from channels.middleware import BaseMiddleware
 from channels.sessions import SessionMiddleware, CookieMiddleware
 from channels.auth import UserLazyObject
 
 
+def get_user_by_token(token, context=None):
+    """
+    graphql_jwt's get_user_by_token, with verified tokens cached in
+    token_cache so that repeated requests skip the signature check and the
+    user query.
+    """
+    user = token_cache.get(token)
+    if user is None:
+        loaded_at = time.time()
+        payload = get_payload(token, context)
+        user = get_user_by_payload(payload)
+        if user is not None:
+            expires = payload.get("exp") if jwt_settings.JWT_VERIFY_EXPIRATION else None
+            token_cache.set(token, user, expires, loaded_at=loaded_at)
+    return user
+
+
+class JSONWebTokenBackend(backends.JSONWebTokenBackend):
+    """Authentication backend of graphql_jwt that uses the token cache."""
+
+    def authenticate(self, request=None, **kwargs):
+        if request is None or getattr(request, '_jwt_token_auth', False):
+            return None
+
+        token = get_credentials(request, **kwargs)
+
+        if token is not None:
+            return get_user_by_token(token, request)
+
+        return None
+
+
 class JWTAuthMiddleware(BaseMiddleware):
     """
     Custom middleware for Graphene JWT
@@ -26,7 +62,7 @@ class JWTAuthMiddleware(BaseMiddleware):
         if token and token.startswith(b"auth="):
             token = token.replace(b"auth=", b"")
             token = token.decode("ascii")
-            user = await database_sync_to_async(get_user_by_token)(token)
+            user = await db_sync_to_async(get_user_by_token)(token)
         else:
             user = AnonymousUser()
         
@@ -0,0 +1,79 @@
+"""
+Channel layers for setups that channels_redis does not cover out of the box.
+
+Which layer is used is decided by the QTEAMS_CHANNEL_LAYER setting, see
+qteams/settings.py.
+"""
+
+import aioredis
+from channels_redis.core import ConnectionPool, RedisChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+
+
+class SentinelConnectionPool(ConnectionPool):
+    """
+    Connection pool that asks Redis Sentinel for the current master.
+
+    The host entry needs "sentinels" (list of addresses) and "master_name";
+    all other keys are passed on to aioredis.create_sentinel.
+    """
+
+    async def pop(self, loop=None):
+        conns, loop = self._ensure_loop(loop)
+        if not conns:
+            host = dict(self.host)
+            sentinels = host.pop("sentinels")
+            master_name = host.pop("master_name")
+            sentinel = await aioredis.create_sentinel(sentinels, loop=loop, **host)
+            conns.append(sentinel.master_for(master_name))
+        conn = conns.pop()
+        if conn.closed:
+            return await self.pop(loop=loop)
+        self.in_use[conn] = loop
+        return conn
+
+
+class SentinelChannelLayer(RedisChannelLayer):
+    """Redis channel layer whose master is discovered through Redis Sentinel."""
+
+    def __init__(self, hosts=None, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        self.pools = [SentinelConnectionPool(host) for host in self.hosts]
+
+
+class FakeRedisConnectionPool(ConnectionPool):
+    """Connection pool that connects to an in-process fakeredis server."""
+
+    server = None
+
+    async def pop(self, loop=None):
+        try:
+            import fakeredis
+            import fakeredis.aioredis
+        except ImportError:
+            raise ImproperlyConfigured("The fakeredis channel layer needs the fakeredis package.")
+
+        if FakeRedisConnectionPool.server is None:
+            FakeRedisConnectionPool.server = fakeredis.FakeServer()
+
+        conns, loop = self._ensure_loop(loop)
+        if not conns:
+            conns.append(await fakeredis.aioredis.create_redis(FakeRedisConnectionPool.server, loop=loop))
+        conn = conns.pop()
+        if conn.closed:
+            return await self.pop(loop=loop)
+        self.in_use[conn] = loop
+        return conn
+
+
+class FakeRedisChannelLayer(RedisChannelLayer):
+    """
+    Redis channel layer backed by fakeredis, for local development and tests.
+
+    All instances in one process share the same fake server, so two layer
+    instances behave like two workers connected to the same Redis.
+    """
+
+    def __init__(self, hosts=None, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        self.pools = [FakeRedisConnectionPool(host) for host in self.hosts]
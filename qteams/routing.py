@@ -1,10 +1,15 @@
+from channels.http import AsgiHandler
 from channels.routing import ProtocolTypeRouter, URLRouter
-from django.urls import path 
+from django.urls import path, re_path
 from .auth import JWTAuthMiddlewareStack
-from graphene_subscriptions.consumers import GraphqlSubscriptionConsumer
+from api.consumers import TeamSubscriptionConsumer, GraphQLHttpConsumer
 
 application = ProtocolTypeRouter({
+    "http": URLRouter([
+        path('', GraphQLHttpConsumer),
+        re_path(r'', AsgiHandler),
+    ]),
     "websocket": (JWTAuthMiddlewareStack(URLRouter([
-        path('', GraphqlSubscriptionConsumer)
+        path('', TeamSubscriptionConsumer)
     ]))),
 })
\ No newline at end of file
@@ -77,19 +77,69 @@ TEMPLATES = [
 WSGI_APPLICATION = 'qteams.wsgi.application'
 ASGI_APPLICATION = "qteams.routing.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-    }
+# Channel layer used by the subscriptions, selected with QTEAMS_CHANNEL_LAYER:
+#   memory    - single process only (default)
+#   redis     - QTEAMS_REDIS_HOSTS, comma separated redis:// URLs
+#   sentinel  - QTEAMS_REDIS_SENTINELS (host:port, comma separated) and QTEAMS_REDIS_MASTER
+#   fakeredis - in-process fake Redis for local development and tests
+CHANNEL_LAYER = os.environ.get("QTEAMS_CHANNEL_LAYER", "memory")
+
+CHANNEL_LAYER_CONFIG = {
+    "capacity": int(os.environ.get("QTEAMS_CHANNEL_CAPACITY", 100)),
+    "expiry": int(os.environ.get("QTEAMS_CHANNEL_EXPIRY", 60)),
+    "group_expiry": int(os.environ.get("QTEAMS_CHANNEL_GROUP_EXPIRY", 86400)),
 }
 
+if CHANNEL_LAYER == "redis":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": dict(
+                CHANNEL_LAYER_CONFIG,
+                hosts=os.environ.get("QTEAMS_REDIS_HOSTS", "redis://localhost:6379").split(","),
+            ),
+        }
+    }
+elif CHANNEL_LAYER == "sentinel":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "qteams.layers.SentinelChannelLayer",
+            "CONFIG": dict(
+                CHANNEL_LAYER_CONFIG,
+                hosts=[{
+                    "sentinels": [
+                        (host, int(port)) for host, port in (
+                            address.split(":") for address in os.environ.get("QTEAMS_REDIS_SENTINELS", "localhost:26379").split(",")
+                        )
+                    ],
+                    "master_name": os.environ.get("QTEAMS_REDIS_MASTER", "mymaster"),
+                }],
+            ),
+        }
+    }
+elif CHANNEL_LAYER == "fakeredis":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "qteams.layers.FakeRedisChannelLayer",
+            "CONFIG": CHANNEL_LAYER_CONFIG,
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": CHANNEL_LAYER_CONFIG,
+        }
+    }
+
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get("QTEAMS_DATABASE", os.path.join(BASE_DIR, 'db.sqlite3')),
+        'CONN_MAX_AGE': int(os.environ.get("QTEAMS_CONN_MAX_AGE", 60)),
     }
 }
 
@@ -97,6 +147,7 @@ GRAPHENE = {
     'SCHEMA': 'qteams.schema.schema',
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'api.metrics.ProfilingMiddleware',
     ],
 }
 
@@ -144,6 +195,96 @@ ALLOWED_HOSTS = [
 ]
 
 AUTHENTICATION_BACKENDS = [
-    'graphql_jwt.backends.JSONWebTokenBackend',
+    'qteams.auth.JSONWebTokenBackend',
     'django.contrib.auth.backends.ModelBackend',
 ]
+
+# Resolve teamUpdated events once per query document and viewer role instead
+# of once per subscriber, see api.subscriptions
+SHARED_SUBSCRIPTION_RESULTS = os.environ.get("QTEAMS_SHARED_SUBSCRIPTIONS", "0") == "1"
+
+# Updates of a team within this many milliseconds are pushed to the
+# subscribers as one event, 0 sends every update right away. Coalesced events
+# are sent from a timer thread, which the in-memory layer does not support.
+TEAM_EVENT_WINDOW = int(os.environ.get("QTEAMS_TEAM_EVENT_WINDOW", 0 if CHANNEL_LAYER == "memory" else 100))
+
+# Number of parsed and validated query documents kept per process
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.environ.get("QTEAMS_DOCUMENT_CACHE_SIZE", 200))
+
+# Threads that execute GraphQL requests over HTTP under ASGI, see
+# api.consumers.GraphQLHttpConsumer
+GRAPHQL_HTTP_THREADS = int(os.environ.get("QTEAMS_GRAPHQL_HTTP_THREADS", 8))
+
+# Threads for the database work of websocket consumers and their
+# authentication, see api.executors. Each thread keeps one connection open
+# for CONN_MAX_AGE seconds, which is checked before it is used again if
+# DB_HEALTH_CHECKS is set.
+DB_EXECUTOR_THREADS = int(os.environ.get("QTEAMS_DB_THREADS", 10))
+DB_HEALTH_CHECKS = os.environ.get("QTEAMS_DB_HEALTH_CHECKS", "1") == "1"
+
+# Member ids of teams are cached per process for this many seconds, see
+# api.cache.MembershipCache
+MEMBERSHIP_CACHE_TTL = int(os.environ.get("QTEAMS_MEMBERSHIP_CACHE_TTL", 60))
+MEMBERSHIP_CACHE_SIZE = 10000
+
+# Django cache through which the processes invalidate each other's
+# membership and token cache entries (api.cache.InvalidationStamps). The
+# default local memory cache does not reach other processes, with several
+# workers configure a shared cache in CACHES.
+SHARED_CACHE = "default"
+# Seconds for which a process reuses the stamps it read from SHARED_CACHE,
+# an invalidation in another process takes effect after at most this long
+SHARED_CACHE_CHECK_INTERVAL = float(os.environ.get("QTEAMS_SHARED_CACHE_CHECK_INTERVAL", 1))
+
+# Verified JSON web tokens are cached for this many seconds, see
+# api.cache.TokenCache, 0 disables the cache
+JWT_CACHE_TTL = int(os.environ.get("QTEAMS_JWT_CACHE_TTL", 60))
+JWT_CACHE_SIZE = 10000
+
+# Connections return at most this many items per page
+GRAPHQL_MAX_PAGE_SIZE = 100
+
+# Limits on the depth and the estimated cost of queries, as (depth, cost)
+# per kind of user, None for no limit. See api.limits.QueryAnalysis for how
+# the cost is estimated.
+GRAPHQL_QUERY_LIMITS = {
+    "anonymous": (10, 1000),
+    "authenticated": (15, 50000),
+    "staff": None,
+}
+# Cost of single fields, "Type.field": cost
+GRAPHQL_FIELD_COSTS = {
+    "Query.questions": 2,
+}
+# Expected number of items of connections that are requested without
+# first or last, instead of GRAPHQL_MAX_PAGE_SIZE
+GRAPHQL_CONNECTION_SIZES = {
+    "TeamNode.members": 20,
+    "TeamNode.membershipSet": 20,
+    "QuestionNode.answerSet": 20,
+}
+
+# Record resolver and operation timings for /metrics/ (api.metrics), and
+# add the timings of a request to the extensions of its response (needs
+# GRAPHQL_PROFILING). Every resolver is timed, so profiling is off by default
+GRAPHQL_PROFILING = os.environ.get("QTEAMS_GRAPHQL_PROFILING", "0") == "1"
+GRAPHQL_PROFILE_RESPONSES = os.environ.get("QTEAMS_GRAPHQL_PROFILE_RESPONSES", "0") == "1"
+# Operation names that get their own series in the operation histograms,
+# comma separated; the operations of all other names are recorded as "other"
+GRAPHQL_PROFILED_OPERATIONS = set(filter(None, os.environ.get("QTEAMS_GRAPHQL_PROFILED_OPERATIONS", "").split(",")))
+# Bearer token that /metrics/ requires when DEBUG is off
+METRICS_TOKEN = os.environ.get("QTEAMS_METRICS_TOKEN")
+
+# Cache that stores the documents of persisted queries, and for how long
+PERSISTED_QUERIES_CACHE = "default"
+PERSISTED_QUERIES_TIMEOUT = None
+
+# Where the leaderboards are ranked, see api.leaderboard: "database" reads
+# the LeaderboardEntry table, "redis" mirrors it into sorted sets at
+# LEADERBOARD_REDIS_URL (needs the redis package)
+LEADERBOARD_BACKEND = os.environ.get("QTEAMS_LEADERBOARD", "database")
+LEADERBOARD_REDIS_URL = os.environ.get("QTEAMS_LEADERBOARD_REDIS", "redis://localhost:6379/1")
+
+# Days after the last answer of a finished team before the archive_rounds
+# command moves its round out of the live tables, see Team.archive
+ARCHIVE_AFTER_DAYS = int(os.environ.get("QTEAMS_ARCHIVE_AFTER_DAYS", "30"))
@@ -16,11 +16,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
-from graphene_django.views import GraphQLView
+from api.views import PersistedQueryGraphQLView, metrics_view
 from django.views.decorators.csrf import csrf_exempt
 from graphql_jwt.decorators import jwt_cookie
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', csrf_exempt(jwt_cookie(GraphQLView.as_view(graphiql=True)))),
+    path('metrics/', metrics_view),
+    path('', csrf_exempt(jwt_cookie(PersistedQueryGraphQLView.as_view(graphiql=True)))),
 ]